@@ -0,0 +1,552 @@
+"""
+The same flow on Playwright's async API.
+
+    python async_main.py                                  # one run with data.json
+    python async_main.py applicants.jsonl --concurrency 3 # several contexts in one process
+
+The states, selectors, timeouts, calendar/slot logic and fill plans all come from
+main.py and form_fill.py; only the browser calls are awaited here. What the async
+API buys is overlap: screenshots are written in the background while the next step
+runs, slot responses are parsed as they arrive while the calendar renders, and the
+error screenshot is taken during the retry backoff. main.py stays the default entry
+point and is unchanged in behaviour.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from playwright.async_api import async_playwright
+
+import main as bot
+from batch import BATCH_STATUS_FILE, MAX_CONCURRENCY, BatchStatus, load_records, pending_records
+from form_fill import fill_plan_async
+from logs import dom_snapshot_async, get_logger
+from routing import install_routing_async
+from selector_cache import selector_registry
+from session import AsyncBrowserSession
+from slots import AsyncSlotCapture
+from tracing import Tracer, set_tracer, span, traced
+from validation import InvalidRecord, prepare_record
+
+log = get_logger('async_main')
+
+async def wait_for_selector_state(page, selector, state="visible", step='default'):
+    """Wait until the selector reaches the given state (attached/detached/visible/hidden)."""
+    return await page.wait_for_selector(selector, state=state, timeout=bot.step_timeout(step))
+
+async def wait_for_url(page, url, step='default'):
+    await page.wait_for_url(url, wait_until=bot.NAVIGATION_WAIT, timeout=bot.step_timeout(step))
+
+async def wait_until_ready(page, page_name, step='default'):
+    return await wait_for_selector_state(page, bot.PAGE_READY_SELECTORS[page_name], step=step)
+
+async def wait_for_dom_mutation(page, selector, action, step='default'):
+    """Run the action coroutine function and wait until the DOM around the selector has mutated."""
+    await page.eval_on_selector(selector, bot.DOM_OBSERVER_JS)
+    await action()
+    await page.wait_for_function('() => window.__autoformMutated === true', timeout=bot.step_timeout(step))
+
+def in_background(run, coroutine, what):
+    """Schedule coroutine alongside the flow; failures are reported, never raised into the step."""
+    async def guarded():
+        try:
+            await coroutine
+        except Exception as e:
+            log.warning(f"Background {what} failed: {e}")
+    task = asyncio.create_task(guarded())
+    run['background'].append(task)
+    return task
+
+async def drain_background(run):
+    """Wait for everything scheduled with in_background()."""
+    tasks, run['background'] = run['background'], []
+    if tasks:
+        await asyncio.gather(*tasks)
+
+async def snapshot_calendar(page, month_index=0):
+    """Async counterpart of main.snapshot_calendar."""
+    await wait_for_selector_state(page, bot.CALENDAR_SELECTOR, step='calendar')
+    return bot.calendar_snapshot(await page.eval_on_selector(bot.CALENDAR_SELECTOR, bot.CALENDAR_SNAPSHOT_JS),
+                                 month_index)
+
+async def click_calendar_day(page, day):
+    await page.locator(f'{bot.CALENDAR_SELECTOR} td a[draggable="false"]:text-is("{day}")').first.click()
+
+async def change_month(page, button_selector, label):
+    """Click the date picker's next/previous month button and wait for the calendar to re-render."""
+    try:
+        await wait_for_selector_state(page, button_selector, step='month_change')
+        button = await page.query_selector(button_selector)
+        if button and await button.is_visible():
+            await wait_for_dom_mutation(page, bot.CALENDAR_SELECTOR, button.click, step='month_change')
+            log.debug(f"Clicked '{label}' button.")
+            return True
+        log.warning(f"{label} button not found or not visible.")
+        return False
+    except Exception as e:
+        log.warning(f"Error navigating to {label.lower()}: {e}")
+        return False
+
+async def go_to_next_month(page):
+    return await change_month(page, *bot.MONTH_BUTTONS['next'])
+
+async def reopen_date_picker(page):
+    """Reopen the date picker after a day click has closed it."""
+    _, date_input = await selector_registry.resolve_async(page, 'date_input')
+    if not date_input:
+        log.warning("Could not reopen date picker.")
+        raise Exception("Failed to reopen date picker to continue the date search.")
+    await date_input.click()
+    await wait_for_selector_state(page, bot.CALENDAR_SELECTOR, step='calendar')
+    log.debug("Reopened date picker.")
+
+async def scan_calendar(page, scan, first_snapshot=None):
+    """Async counterpart of main.scan_calendar; first_snapshot stands in for reading the first month."""
+    log.debug("Scanning the calendar for appointment dates.")
+    while True:
+        with span(f"Calendar month {scan.months_read + 1}", kind='month_scan'):
+            snapshot, first_snapshot = first_snapshot, None
+            no_slots = await page.locator(bot.NO_SLOTS_SELECTOR).is_visible()
+            if snapshot is None and (not no_slots or await page.is_visible(bot.CALENDAR_SELECTOR)):
+                snapshot = await snapshot_calendar(page, month_index=scan.months_read)
+            scan.add_month(snapshot, no_slots)
+        if not scan.wants_more():
+            return scan.take_candidates()
+        if not await go_to_next_month(page):
+            raise Exception("Failed to navigate to the next month.")
+
+async def go_to_month(page, year, month):
+    """Async counterpart of main.go_to_month; returns the month's snapshot or None."""
+    for _ in range(bot.MAX_MONTH_MOVES):
+        snapshot = await snapshot_calendar(page)
+        move = bot.month_move(snapshot, year, month)
+        if move == 'here':
+            return snapshot
+        if move is None or not await change_month(page, *bot.MONTH_BUTTONS[move]):
+            return None
+    return None
+
+async def read_time_chips(page):
+    """Map 'HH:MM' -> chip text for every enabled time chip, from one read of the chip list."""
+    await wait_for_selector_state(page, bot.TIME_CHIP_LIST_SELECTOR, step='time_slots')
+    return bot.time_chips(await page.eval_on_selector_all('mat-chip', bot.TIME_CHIPS_JS))
+
+async def select_slot_on(page, day, preferences, times=None):
+    """Async counterpart of main.select_slot_on."""
+    if not await page.is_visible(bot.CALENDAR_SELECTOR):
+        await reopen_date_picker(page)
+    if not bot.day_selectable(await go_to_month(page, day.year, day.month), day):
+        return False
+    await click_calendar_day(page, day.day)
+    log.info(f"Selected date: {day.isoformat()}")
+
+    chip = bot.pick_time_chip(await read_time_chips(page), preferences, day, times)
+    if chip is None:
+        return False
+    await page.locator(f'{bot.TIME_SLOT_SELECTOR}:text-is("{chip}")').first.click()
+    log.info(f"Selected time: {chip}")
+    return True
+
+async def choose_calendar_slot(page, preferences, first_snapshot=None):
+    """Async counterpart of main.choose_calendar_slot, starting and resuming the scan the same way."""
+    scan = bot.CalendarScan(preferences)
+    month = scan.expected_month()
+    while True:
+        if first_snapshot is None:
+            if not await page.is_visible(bot.CALENDAR_SELECTOR):
+                await reopen_date_picker(page)
+            first_snapshot = await go_to_month(page, *month)
+            if first_snapshot is None:
+                return bot.scan_unreachable(scan, month)
+        for day in await scan_calendar(page, scan, first_snapshot):
+            try:
+                if await select_slot_on(page, day, preferences):
+                    return True
+            except Exception as e:
+                log.warning(f"Error selecting date {day.isoformat()}: {e}")
+        month = scan.resume_month()
+        if month is None:
+            return False
+        log.info(f"No scanned date offered an allowed time, scanning on from {month[0]}-{month[1]:02d}.")
+        first_snapshot = None
+
+async def select_slot_from_capture(page, slot_capture, preferences):
+    """Async counterpart of main.select_slot_from_capture."""
+    for day, times in bot.captured_days(slot_capture, preferences):
+        if await select_slot_on(page, day, preferences, times=times):
+            return True
+    return False
+
+async def step_home(page, run):
+    await page.goto(bot.portal_url(), wait_until=bot.NAVIGATION_WAIT, timeout=bot.step_timeout('navigation'))
+    await wait_until_ready(page, 'home', step='navigation')
+    if await page.query_selector('text="Log In"') or await page.query_selector('text="Login"'):
+        log.error("Login required, please log in manually.")
+        raise Exception("Login required, stopping for manual intervention.")
+
+async def step_first_issuance(page, run):
+    await page.click('text="First Issuance"')
+    await wait_for_url(page, bot.portal_url('request-service'), step='request_service')
+
+async def step_passport_type(page, run):
+    await wait_until_ready(page, 'request_service', step='passport_type')
+    is_selected = await page.eval_on_selector(bot.PASSPORT_RADIO_SELECTOR,
+                                              'element => element.previousElementSibling.checked')
+    if not is_selected:
+        await page.click(bot.PASSPORT_RADIO_SELECTOR)
+        log.info("Selected Ordinary 34 pages")
+    else:
+        log.debug("Ordinary 34 pages is already selected")
+    await wait_for_selector_state(page, bot.PASSPORT_RADIO_CHECKED_SELECTOR, state="attached", step='passport_type')
+
+async def step_proceed(page, run):
+    await wait_for_selector_state(page, selector_registry.combined('proceed'), step='proceed')
+    proceed_selector, proceed_button = await selector_registry.resolve_async(page, 'proceed')
+    if not proceed_selector:
+        raise Exception("Proceed button not found.")
+    await proceed_button.scroll_into_view_if_needed()
+
+    for click_attempt in range(3):
+        try:
+            await page.click(proceed_selector)
+            log.debug(f"Successfully clicked Proceed on attempt {click_attempt + 1}")
+            break
+        except Exception as e:
+            log.warning(f"Click attempt {click_attempt + 1} failed: {e}, retrying...")
+            await wait_for_selector_state(page, proceed_selector, step='proceed')
+    else:
+        await selector_registry.evict_async(page, 'proceed')
+        raise Exception("Failed to click Proceed button after 3 attempts")
+
+    await wait_for_selector_state(page, bot.AFTER_PROCEED_SELECTOR, step='proceed')
+
+    # The screenshot is written while the terms step already runs
+    in_background(run, page.screenshot(path=bot.artifact_path(run, 'post_proceed.png')), 'post-proceed screenshot')
+
+    await dom_snapshot_async(page, "Page after clicking Proceed")
+
+    if page.url == bot.portal_url():
+        log.warning("Detected redirect to homepage, attempting to restart...")
+        raise Exception("Redirected to the home page after clicking Proceed.")
+
+async def step_terms(page, run):
+    await wait_for_selector_state(page, bot.AGREE_SELECTOR, step='terms')
+    await page.click(bot.AGREE_SELECTOR)
+    log.info("Clicked 'I agree' on the modal")
+
+async def choose_option(page, select_selector, option_text):
+    await page.click(select_selector)
+    await wait_for_selector_state(page, 'mat-option', step='dropdown')
+    await page.click(f'mat-option span:text("{option_text}")')
+    # The option panel closes once the selection has been applied
+    await wait_for_selector_state(page, 'mat-option', state="hidden", step='dropdown')
+
+async def open_date_picker(page):
+    """Trigger the date picker, trying the selector that worked last time first."""
+    log.debug("Attempting to trigger the date picker")
+    date_input_triggered = False
+    selector, date_input = await selector_registry.resolve_async(page, 'date_input')
+    if date_input:
+        try:
+            await date_input.click()
+            log.debug(f"Clicked date input using selector: {selector}")
+            date_input_triggered = True
+        except Exception as e:
+            log.warning(f"Failed to click selector {selector}: {e}")
+            await selector_registry.evict_async(page, 'date_input')
+    if not date_input_triggered:
+        log.warning("No specific date input found, trying generic click on form fields")
+        try:
+            await page.click(bot.GENERIC_DATE_TRIGGER_SELECTOR, timeout=bot.step_timeout('dropdown'))
+        except Exception as e:
+            log.warning(f"Generic click failed: {e}")
+
+    log.debug("Waiting for the calendar to appear")
+    await wait_for_selector_state(page, bot.CALENDAR_SELECTOR, step='calendar')
+
+async def select_appointment_slot(page, run, country, location):
+    """Async counterpart of main.select_appointment_slot."""
+    slot_capture = run.get('slot_capture')
+    if slot_capture:
+        slot_capture.reset()
+
+    log.info(f"Selecting appointment country as {country}")
+    await choose_option(page, '#mat-select-0', country)
+    log.info(f"Selecting appointment location as {location}")
+    await choose_option(page, '#mat-select-1', location)
+    await open_date_picker(page)
+
+    await dom_snapshot_async(page, f"Appointment form for {location}", 'form')
+
+    if bot.DEBUG:
+        log.info(f"Pausing for {bot.INSPECTION_PAUSE_MS // 1000} seconds to allow manual inspection...")
+        await page.wait_for_timeout(bot.INSPECTION_PAUSE_MS)
+
+    preferences = run['preferences']
+    first_snapshot = None
+    if slot_capture:
+        # Move the picker to the current month while the slot responses are still being parsed
+        has_data, first_snapshot = await asyncio.gather(
+            slot_capture.wait_for_data(bot.step_timeout('slot_data')),
+            go_to_month(page, preferences.today.year, preferences.today.month))
+        if has_data:
+            if await select_slot_from_capture(page, slot_capture, preferences):
+                return True
+            # The capture path may have moved the picker
+            first_snapshot = None
+    return await choose_calendar_slot(page, preferences, first_snapshot)
+
+async def submit_captcha(page, run):
+    """Async counterpart of main.submit_captcha."""
+    handoff = run['captcha']
+    if run.get('captcha_push'):
+        # Let the hand-over started with the step finish before deciding to push again
+        await run.pop('captcha_push')
+    for attempt in bot.captcha_attempts(handoff):
+        if not handoff.waiting:
+            await handoff.push_async(page, bot.step_timeout('captcha_image'))
+        captcha_text = await handoff.collect_async(page, bot.step_timeout('captcha_answer'))
+        captcha_selector, _ = await selector_registry.resolve_async(page, 'captcha_input')
+        if not captcha_selector:
+            handoff.report(None)
+            raise Exception("Captcha input not found.")
+        await page.fill(captcha_selector, captcha_text)
+        await page.evaluate(bot.CAPTCHA_OUTCOME_JS, bot.CAPTCHA_ERROR_SELECTOR)
+        await page.click(bot.CAPTCHA_NEXT_SELECTOR)
+        try:
+            await page.wait_for_function(bot.CAPTCHA_JUDGED_JS, arg='/appointment',
+                                         timeout=bot.step_timeout('captcha_result'))
+        except Exception:
+            handoff.report(None)
+            raise
+        if bot.captcha_accepted(handoff, page.url, attempt):
+            return
+
+async def step_appointment(page, run):
+    await wait_for_url(page, bot.portal_url('appointment'), step='appointment')
+
+    log.debug("Waiting for appointment form elements")
+    await wait_until_ready(page, 'appointment', step='appointment')
+    # The captcha is handed over while the dropdowns and the calendar are worked through
+    run['captcha_push'] = in_background(
+        run, run['captcha'].push_async(page, bot.step_timeout('captcha_image')), "captcha hand-over")
+    await wait_for_selector_state(page, '#mat-select-1', step='appointment')
+
+    for country, location in run['preferences'].locations:
+        if await select_appointment_slot(page, run, country, location):
+            break
+        log.warning(f"No allowed slot at {location}, trying the next location.")
+        if await page.is_visible(bot.CALENDAR_SELECTOR):
+            await page.keyboard.press('Escape')
+    else:
+        raise Exception("No appointment slot matching the applicant's preferences at any location.")
+
+    await submit_captcha(page, run)
+
+@traced('fill')
+async def fill_request_section(page, section, plan):
+    log.info(f"Filling {section.replace('_', ' ')} section")
+    await fill_plan_async(page, plan)
+    await page.click(bot.FORM_NEXT_SELECTOR)
+
+async def step_request_form(page, run):
+    await wait_for_url(page, bot.portal_url('request-form'), step='request_form')
+    await wait_until_ready(page, 'request_form', step='request_form')
+
+    # On a resumed run earlier sections are already submitted; start at the one on screen
+    shown = await page.evaluate(bot.CURRENT_SECTION_JS, bot.section_first_selectors())
+    for section in bot.FORM_SECTION_ORDER[max(shown, 0):]:
+        await fill_request_section(page, section, run['fill_plans'][section])
+
+async def step_final_screenshot(page, run):
+    try:
+        await page.screenshot(path=bot.artifact_path(run, 'final_page.png'), timeout=bot.step_timeout('screenshot'))
+    except Exception as e:
+        log.warning(f"Failed to take final screenshot: {e}")
+
+# Async step for each state id of main.STATES; labels, entry checks and retry budgets are shared
+ASYNC_STEPS = {
+    'home': step_home,
+    'first_issuance': step_first_issuance,
+    'passport_type': step_passport_type,
+    'proceed': step_proceed,
+    'terms': step_terms,
+    'appointment': step_appointment,
+    'request_form': step_request_form,
+    'final_screenshot': step_final_screenshot,
+}
+
+async def passes_entry_check(page, check):
+    """Evaluate a main.entry_check() check against an async page."""
+    if check is None:
+        return True
+    if check.path is not None and not bot.on_portal_path(page.url, check.path):
+        return False
+    return check.selector is None or await page.is_visible(check.selector)
+
+async def resume_index(page, failed_index):
+    """Async counterpart of main.resume_index."""
+    for index, check in bot.resume_candidates(failed_index):
+        if await passes_entry_check(page, check):
+            return index
+    return 0
+
+async def take_error_screenshot(page, run):
+    try:
+        await page.screenshot(path=bot.artifact_path(run, 'error_page.png'), timeout=bot.step_timeout('screenshot'))
+    except Exception as e_shot:
+        log.warning(f"Failed to take error screenshot: {e_shot}")
+
+async def run_with_retries(page, run):
+    """Async counterpart of main.run_with_retries, with the same checkpoints and retry budgets."""
+    progress = bot.RunProgress(run)
+    try:
+        while not progress.finished:
+            state, label, _, _ = progress.state
+            progress.checkpoint('Running')
+            try:
+                log.info(label)
+                with span(label, kind=progress.span_kind, state=state):
+                    await ASYNC_STEPS[state](page, run)
+                progress.step_done()
+                continue
+            except Exception as e:
+                log.error(f"An error occurred in state '{state}': {e}")
+                await dom_snapshot_async(page, f"Page on error in state '{state}'", level=logging.WARNING)
+
+            backoff = progress.step_failed()
+            if backoff is None:
+                await take_error_screenshot(page, run)
+                return False
+            # The error screenshot is taken during the backoff rather than before it
+            await asyncio.gather(take_error_screenshot(page, run), asyncio.sleep(backoff / 1000))
+            progress.resume_at(await resume_index(page, progress.index))
+    finally:
+        await drain_background(run)
+
+    progress.succeeded()
+    return True
+
+async def accept_dialog(dialog):
+    await dialog.accept()
+
+def new_run(page, data, record_id=None, fill_plans=None):
+    """Async counterpart of main.new_run; run['background'] holds the tasks started by in_background()."""
+    page.on("dialog", accept_dialog)
+    slot_capture = AsyncSlotCapture(page) if bot.SLOT_SOURCE == 'network' else None
+    run = bot.run_state(data, record_id, fill_plans, slot_capture)
+    run['background'] = []
+    return run
+
+async def run_in_session(session, data, fill_plans, record_id=None, configure_run=None):
+    """Run the flow for one applicant in the opened session's context. Returns True on success."""
+    tracer = Tracer(bot.TRACE_FILE, run_id=record_id)
+    set_tracer(tracer)
+    router = await install_routing_async(session.context, bot.portal_url())
+    if await session.validate(bot.portal_url(), bot.PAGE_READY_SELECTORS['home'], bot.step_timeout('navigation')):
+        log.info("Reusing stored session.")
+    page = tracer.wrap_page(await session.new_page())
+    run = new_run(page, data, record_id=record_id, fill_plans=fill_plans)
+    if configure_run:
+        configure_run(run)
+    succeeded = await run_with_retries(page, run)
+    if router:
+        router.print_stats()
+    tracer.print_summary()
+    return succeeded
+
+async def main_async():
+    try:
+        with open('data.json', 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        log.error("Error: data.json not found. Please create a data.json file with your form data.")
+        return
+    try:
+        fill_plans = prepare_record(data)
+    except InvalidRecord as e:
+        for error in e.errors:
+            log.error(f"data.json: {error}")
+        bot.write_status(bot.STATUS_FILE, 'Invalid', errors=e.errors)
+        return
+    async with async_playwright() as p:
+        session = AsyncBrowserSession(p, headless=bot.HEADLESS)
+        await session.open()
+        try:
+            await run_in_session(session, data, fill_plans)
+            await session.save_state()
+        finally:
+            await session.close()
+
+async def run_records_async(records, concurrency=2, min_interval=0.0, status_path=BATCH_STATUS_FILE):
+    """
+    Run every record that has not succeeded yet, each in its own context of one browser,
+    at most `concurrency` at a time. Progress goes to the same status file as batch.py.
+    """
+    status = BatchStatus(status_path)
+    pending = pending_records(records, status)
+    if not pending:
+        return status.records
+    slots = asyncio.Semaphore(max(1, min(concurrency, MAX_CONCURRENCY)))
+    # Prompt mode only: the prompts run in threads, and one operator answers them one at a time
+    prompt_lock = threading.Lock()
+    start_lock = asyncio.Lock()
+    last_start = [0.0]
+
+    def configure(run, record_id):
+        def locked_prompt(page):
+            with prompt_lock:
+                log.info(f"[{record_id}] captcha required")
+                return bot.solve_captcha(page)
+        run['captcha'].prompt = locked_prompt
+        run['checkpoint'] = lambda state_status, **details: status.update(record_id, state_status, **details)
+
+    async def run_record(p, browser, record_id, record, fill_plans):
+        async with slots:
+            async with start_lock:
+                delay = last_start[0] + min_interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                last_start[0] = time.monotonic()
+            status.start(record_id)
+            # Records need isolated cookies, so each gets a fresh context with the stored session
+            session = AsyncBrowserSession(p, browser=browser, shared_context=False)
+            try:
+                await session.open()
+                await run_in_session(session, record, fill_plans, record_id, lambda run: configure(run, record_id))
+            except Exception as e:
+                log.error(f"[{record_id}] run crashed: {e}")
+                status.update(record_id, 'Failed', error=str(e)[:500])
+            finally:
+                if session.context:
+                    await session.close()
+
+    async with async_playwright() as p:
+        browser = await AsyncBrowserSession(p, headless=bot.HEADLESS).launch()
+        await asyncio.gather(*(run_record(p, browser, *job) for job in pending))
+        await browser.close()
+    return status.records
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the form with the async Playwright engine.")
+    parser.add_argument('records', nargs='?', help="JSONL or CSV file of applicant records; data.json when omitted")
+    parser.add_argument('--concurrency', type=int, default=2, help=f"Parallel contexts (at most {MAX_CONCURRENCY})")
+    parser.add_argument('--min-interval', type=float, default=5.0, help="Minimum seconds between record starts")
+    parser.add_argument('--status-file', default=BATCH_STATUS_FILE)
+    args = parser.parse_args()
+
+    if not args.records:
+        asyncio.run(main_async())
+        return
+    results = asyncio.run(run_records_async(load_records(args.records), args.concurrency,
+                                            args.min_interval, args.status_file))
+    counts = {}
+    for entry in results.values():
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    print("Batch finished: " + ", ".join(f"{count} {name}" for name, count in sorted(counts.items())))
+
+if __name__ == '__main__':
+    main()
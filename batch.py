@@ -0,0 +1,208 @@
+"""
+Run many applicants through the flow with a small pool of browser contexts that
+share one browser process.
+
+    python batch.py applicants.jsonl --concurrency 2 --min-interval 10
+
+Records use the data.json schema, one JSON object per line or one CSV row each;
+an 'id' field (or the line number) identifies the record. Progress is kept in
+batch_status.json, and records that already succeeded are skipped on the next
+run, so a crashed batch resumes where it stopped.
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime
+
+from playwright.sync_api import sync_playwright
+
+import main as bot
+from logs import get_logger
+from routing import install_routing
+from session import CDP_URL, BrowserSession
+from tracing import Tracer, set_tracer
+from validation import InvalidRecord, prepare_record
+
+log = get_logger('batch')
+
+BATCH_STATUS_FILE = os.environ.get('AUTOFORM_BATCH_STATUS_FILE', 'batch_status.json')
+MAX_CONCURRENCY = 4
+
+def load_records(path):
+    """Return [(record_id, record)] from a .jsonl or .csv file of applicant records."""
+    records = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    for line_number, row in enumerate(rows, start=1):
+        records.append((str(row.get('id') or line_number), row))
+    return records
+
+class BatchStatus:
+    """
+    Per-record status in the same shape as status.json ({"status": ...}), keyed by
+    record id and rewritten atomically after every change.
+    """
+
+    def __init__(self, path=BATCH_STATUS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.records = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.records = {}
+
+    def done(self, record_id):
+        return self.records.get(record_id, {}).get('status') == 'Success'
+
+    def start(self, record_id):
+        """Mark a record as running and count the attempt."""
+        attempts = self.records.get(record_id, {}).get('attempts', 0) + 1
+        self.update(record_id, 'Running', attempts=attempts)
+
+    def update(self, record_id, status, **details):
+        with self.lock:
+            entry = self.records.setdefault(record_id, {'attempts': 0})
+            entry.update(details, status=status, updated=datetime.now().isoformat(timespec='seconds'))
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.records, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+class Pacer:
+    """Spaces out record starts across all workers by at least min_interval seconds."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.last_start = 0.0
+
+    def wait_turn(self):
+        with self.lock:
+            delay = self.last_start + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.last_start = time.monotonic()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def pending_records(records, status):
+    """
+    The records still to run, as (record_id, record, fill plans). Records that already
+    succeeded are skipped and invalid ones are marked 'Invalid' without opening a browser.
+    """
+    pending = []
+    for record_id, record in records:
+        if status.done(record_id):
+            log.info(f"[{record_id}] already succeeded, skipping.")
+            continue
+        try:
+            fill_plans = prepare_record(record)
+        except InvalidRecord as e:
+            log.error(f"[{record_id}] invalid record: {e}")
+            status.update(record_id, 'Invalid', errors=e.errors)
+            continue
+        pending.append((record_id, record, fill_plans))
+    return pending
+
+def worker(cdp_url, jobs, status, pacer, captcha_lock):
+    """
+    Pull records off the queue and run each in its own context of the shared browser.
+    Every worker thread has its own Playwright connection, as the sync API requires.
+    """
+    with sync_playwright() as p:
+        while True:
+            try:
+                record_id, record, fill_plans = jobs.get_nowait()
+            except queue.Empty:
+                return
+            pacer.wait_turn()
+            status.start(record_id)
+            tracer = Tracer(bot.TRACE_FILE, run_id=record_id)
+            set_tracer(tracer)
+            session = BrowserSession(p, cdp_url=cdp_url, shared_context=False)
+            try:
+                context = session.open()
+                install_routing(context, bot.portal_url())
+                page = tracer.wrap_page(session.new_page())
+                run = bot.new_run(page, record, record_id=record_id, fill_plans=fill_plans)
+
+                def solve_captcha(page, record_id=record_id):
+                    # In prompt mode one operator answers the prompts one record at a time
+                    with captcha_lock:
+                        log.info(f"[{record_id}] captcha required")
+                        return bot.solve_captcha(page)
+                run['captcha'].prompt = solve_captcha
+                # Step checkpoints go into this record's entry instead of status.json
+                run['checkpoint'] = lambda state_status, record_id=record_id, **details: \
+                    status.update(record_id, state_status, **details)
+
+                bot.run_with_retries(page, run)
+            except Exception as e:
+                log.error(f"[{record_id}] batch run crashed: {e}")
+                status.update(record_id, 'Failed', error=str(e)[:500])
+            finally:
+                try:
+                    session.close()
+                except Exception as e:
+                    log.warning(f"[{record_id}] could not close the session: {e}")
+                set_tracer(None)
+
+def run_batch(records, concurrency=2, min_interval=0.0, status_path=BATCH_STATUS_FILE, cdp_url=CDP_URL):
+    """Run every valid record that has not succeeded yet. Returns the status table."""
+    status = BatchStatus(status_path)
+    jobs = queue.Queue()
+    for job in pending_records(records, status):
+        jobs.put(job)
+    if jobs.empty():
+        return status.records
+
+    concurrency = max(1, min(concurrency, MAX_CONCURRENCY, jobs.qsize()))
+    pacer = Pacer(min_interval)
+    captcha_lock = threading.Lock()
+
+    with sync_playwright() as p:
+        browser = None
+        if not cdp_url:
+            # One browser process for the whole batch; workers attach to it over CDP
+            port = free_port()
+            browser = p.chromium.launch(headless=bot.HEADLESS, args=[f'--remote-debugging-port={port}'])
+            cdp_url = f'http://127.0.0.1:{port}'
+        threads = [threading.Thread(target=worker, args=(cdp_url, jobs, status, pacer, captcha_lock),
+                                    name=f'batch-worker-{i + 1}')
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if browser:
+            browser.close()
+    return status.records
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the form for many applicants with a bounded worker pool.")
+    parser.add_argument('records', help="JSONL or CSV file of applicant records (data.json schema)")
+    parser.add_argument('--concurrency', type=int, default=2, help=f"Parallel contexts (at most {MAX_CONCURRENCY})")
+    parser.add_argument('--min-interval', type=float, default=5.0, help="Minimum seconds between record starts")
+    parser.add_argument('--status-file', default=BATCH_STATUS_FILE)
+    args = parser.parse_args()
+
+    results = run_batch(load_records(args.records), args.concurrency, args.min_interval, args.status_file)
+    counts = {}
+    for entry in results.values():
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    print("Batch finished: " + ", ".join(f"{count} {name}" for name, count in sorted(counts.items())))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+End-to-end latency benchmark: runs the full flow headless against the mock portal
+and reports the wall time of every step.
+
+    python benchmark.py --runs 3 --slot-density 0.2 --month-depth 2
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from playwright.sync_api import sync_playwright
+
+from captcha_inbox import CaptchaHandoff
+from mock_portal.server import FIXTURES_DIR, start_server
+from tracing import Tracer, set_tracer
+
+def run_once(browser, base_url, data, steps, new_run, install_routing):
+    """Run every step once in a fresh context and return [(step name, seconds, browser round-trips)]."""
+    tracer = Tracer(path=None)
+    set_tracer(tracer)
+    context = browser.new_context()
+    install_routing(context, base_url)
+    page = tracer.wrap_page(context.new_page())
+    run = new_run(page, data)
+    # The mock portal accepts any answer; no inbox and no stats for benchmark runs
+    run['captcha'] = CaptchaHandoff(prompt=lambda page: 'benchmark', stats_path=None)
+    timings = []
+    try:
+        for name, step in steps:
+            started = time.perf_counter()
+            round_trips = tracer.round_trips
+            step(page, run)
+            timings.append((name, time.perf_counter() - started, tracer.round_trips - round_trips))
+    finally:
+        context.close()
+    return timings
+
+def print_report(results):
+    """Per-step min/median/max table over all runs, followed by the end-to-end totals."""
+    names = [name for name, _, _ in results[0]]
+    width = max(len(name) for name in names)
+    print(f"\n{'Step'.ljust(width)}  {'min':>8}  {'median':>8}  {'max':>8}  {'trips':>6}")
+    for i, name in enumerate(names):
+        values = [timings[i][1] for timings in results]
+        trips = statistics.median(timings[i][2] for timings in results)
+        print(f"{name.ljust(width)}  {min(values):8.3f}  {statistics.median(values):8.3f}  {max(values):8.3f}  {trips:6.0f}")
+    totals = [sum(seconds for _, seconds, _ in timings) for timings in results]
+    trips = statistics.median(sum(t for _, _, t in timings) for timings in results)
+    print(f"{'Total'.ljust(width)}  {min(totals):8.3f}  {statistics.median(totals):8.3f}  {max(totals):8.3f}  {trips:6.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the booking flow against the mock portal.")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--slot-density', type=float, default=0.3)
+    parser.add_argument('--month-depth', type=int, default=0)
+    parser.add_argument('--times-per-day', type=int, default=6)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--slot-source', choices=['dom', 'network'], default='dom')
+    parser.add_argument('--profile', choices=['lean', 'full'], default='lean')
+    parser.add_argument('--data', default=os.path.join(FIXTURES_DIR, 'applicant.json'))
+    parser.add_argument('--json', help="Also write the raw timings to this file")
+    args = parser.parse_args()
+
+    server, base_url = start_server(slot_density=args.slot_density, month_depth=args.month_depth,
+                                    times_per_day=args.times_per_day, latency_ms=args.latency_ms)
+    # main reads its configuration from the environment at import time
+    os.environ['PASSPORT_BASE_URL'] = base_url
+    os.environ['AUTOFORM_SLOT_SOURCE'] = args.slot_source
+    os.environ['AUTOFORM_PROFILE'] = args.profile
+    import main as bot
+
+    with open(args.data, 'r') as f:
+        data = json.load(f)
+
+    results = []
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            for run_index in range(args.runs):
+                print(f"Benchmark run {run_index + 1} of {args.runs}")
+                results.append(run_once(browser, base_url, data, bot.STEPS, bot.new_run, bot.install_routing))
+            browser.close()
+    finally:
+        server.shutdown()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            runs = [{name: {'seconds': seconds, 'round_trips': trips} for name, seconds, trips in timings}
+                    for timings in results]
+            json.dump({'config': vars(args), 'runs': runs}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Captcha handoff between the bot and a human operator.
+
+With AUTOFORM_CAPTCHA_MODE=inbox (the default) a run saves the captcha image into
+the inbox directory as soon as the appointment page shows it and carries on with
+the calendar; it only waits for the answer when it is about to submit. Answer from
+a second terminal, for any number of runs at once:
+
+    python captcha_inbox.py watch          # shows each new captcha and asks for the text
+    python captcha_inbox.py answer <id> <text>
+    python captcha_inbox.py stats          # operator latency and accept rate
+
+AUTOFORM_CAPTCHA_MODE=prompt asks on the bot's own terminal instead. Every attempt,
+in either mode, is appended to captcha_stats.jsonl with the operator's latency and
+whether the portal accepted the answer.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from logs import get_logger
+from selector_cache import selector_registry
+
+log = get_logger('captcha')
+
+CAPTCHA_MODE = os.environ.get('AUTOFORM_CAPTCHA_MODE', 'inbox')
+CAPTCHA_INBOX_DIR = os.environ.get('AUTOFORM_CAPTCHA_INBOX_DIR', 'captcha_inbox')
+CAPTCHA_STATS_FILE = os.environ.get('AUTOFORM_CAPTCHA_STATS_FILE', 'captcha_stats.jsonl')
+# How often a waiting run looks for the operator's answer
+CAPTCHA_POLL_MS = int(os.environ.get('AUTOFORM_CAPTCHA_POLL_MS', '500'))
+
+# True once an <img> captcha has finished loading (canvas captchas are drawn at once)
+IMAGE_LOADED_JS = "el => el.tagName !== 'IMG' || (el.complete && el.naturalWidth > 0)"
+
+def write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class CaptchaInbox:
+    """
+    A directory of pending captchas: <id>.png and <id>.json per request, and <id>.answer
+    once the operator has answered. Files are removed when the run is done with them.
+    """
+
+    def __init__(self, directory=CAPTCHA_INBOX_DIR):
+        self.directory = directory
+
+    def path(self, request_id, suffix):
+        return os.path.join(self.directory, request_id + suffix)
+
+    def push(self, image, record_id=None, attempt=1, url=''):
+        """Add a captcha image to the inbox and return its request id."""
+        os.makedirs(self.directory, exist_ok=True)
+        request_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}"
+        request = {'id': request_id, 'record_id': record_id, 'attempt': attempt, 'url': url,
+                   'created': time.time(), 'image': os.path.abspath(self.path(request_id, '.png'))}
+        write_atomic(self.path(request_id, '.png'), image)
+        # The .json goes last: a request is only listed once its image is complete
+        write_atomic(self.path(request_id, '.json'), json.dumps(request).encode('utf-8'))
+        return request_id
+
+    def answer(self, request_id, text):
+        if not os.path.exists(self.path(request_id, '.json')):
+            raise KeyError(f"No pending captcha {request_id}")
+        write_atomic(self.path(request_id, '.answer'), text.strip().encode('utf-8'))
+
+    def poll(self, request_id):
+        """Return (answer, seconds since epoch it was given) or None while unanswered."""
+        path = self.path(request_id, '.answer')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read().strip(), os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+    def pending(self):
+        """Unanswered requests, oldest first."""
+        requests = []
+        if not os.path.isdir(self.directory):
+            return requests
+        for name in sorted(os.listdir(self.directory)):
+            request_id, ext = os.path.splitext(name)
+            if ext != '.json' or os.path.exists(self.path(request_id, '.answer')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    requests.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return requests
+
+    def remove(self, request_id):
+        for suffix in ('.json', '.png', '.answer'):
+            try:
+                os.remove(self.path(request_id, suffix))
+            except FileNotFoundError:
+                pass
+
+def record_attempt(path, **entry):
+    """Append one captcha attempt to the stats file."""
+    if not path:
+        return
+    entry['time'] = datetime.now().isoformat(timespec='seconds')
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+    except OSError as e:
+        log.warning(f"Could not record captcha attempt: {e}")
+
+class CaptchaHandoff:
+    """
+    One run's side of the exchange. push() hands the captcha over without waiting;
+    collect() returns the answer, waiting only if the operator has not given it yet;
+    report() records whether the portal took it. Without an inbox, collect() calls
+    prompt(page) instead (e.g. main.solve_captcha). Sync and async pages are supported
+    through the *_async methods.
+    """
+
+    def __init__(self, inbox=None, prompt=None, record_id=None, stats_path=CAPTCHA_STATS_FILE):
+        self.inbox = inbox
+        self.prompt = prompt
+        self.record_id = record_id
+        self.stats_path = stats_path
+        self.attempt = 0
+        self.request_id = None
+        self.pushed_at = None
+        self.answered_at = None
+
+    @property
+    def mode(self):
+        return 'inbox' if self.inbox else 'prompt'
+
+    @property
+    def waiting(self):
+        """True while a pushed captcha has not been reported on."""
+        return self.request_id is not None
+
+    def hand_over(self, image, url):
+        self.withdraw()
+        self.attempt += 1
+        self.request_id = self.inbox.push(image, self.record_id, self.attempt, url)
+        self.pushed_at = time.time()
+        self.answered_at = None
+        log.info(f"Captcha {self.request_id} is waiting in {self.inbox.directory} "
+                 f"(answer with: python captcha_inbox.py answer {self.request_id} <text>)")
+
+    def push(self, page, timeout_ms):
+        """Capture the captcha image and put it in the inbox. A no-op in prompt mode."""
+        if not self.inbox:
+            return
+        _, image_element = selector_registry.resolve(page, 'captcha_image')
+        if image_element:
+            page.wait_for_function(IMAGE_LOADED_JS, arg=image_element, timeout=timeout_ms)
+            image = image_element.screenshot(timeout=timeout_ms)
+        else:
+            log.warning("Captcha image not found, handing over a screenshot of the page.")
+            image = page.screenshot(timeout=timeout_ms)
+        self.hand_over(image, page.url)
+
+    async def push_async(self, page, timeout_ms):
+        if not self.inbox:
+            return
+        _, image_element = await selector_registry.resolve_async(page, 'captcha_image')
+        if image_element:
+            await page.wait_for_function(IMAGE_LOADED_JS, arg=image_element, timeout=timeout_ms)
+            image = await image_element.screenshot(timeout=timeout_ms)
+        else:
+            log.warning("Captcha image not found, handing over a screenshot of the page.")
+            image = await page.screenshot(timeout=timeout_ms)
+        self.hand_over(image, page.url)
+
+    def take_answer(self):
+        """The operator's answer if it has arrived, else None."""
+        answer = self.inbox.poll(self.request_id)
+        if answer is None:
+            return None
+        text, self.answered_at = answer
+        log.info(f"Captcha answer received after {self.answered_at - self.pushed_at:.1f} s.")
+        return text
+
+    def timed_out(self, timeout_ms):
+        self.report(None, outcome='timeout')
+        return Exception(f"No captcha answer from the operator within {timeout_ms / 1000:g} s.")
+
+    def collect(self, page, timeout_ms):
+        """
+        The answer for the pushed captcha, or the prompt's answer in prompt mode. Waits with
+        page.wait_for_timeout, so Playwright keeps servicing the page meanwhile.
+        """
+        if not self.inbox:
+            self.attempt += 1
+            self.pushed_at = time.time()
+            text = self.prompt(page)
+            self.answered_at = time.time()
+            return text
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            text = self.take_answer()
+            if text is not None:
+                return text
+            if time.monotonic() > deadline:
+                raise self.timed_out(timeout_ms)
+            page.wait_for_timeout(CAPTCHA_POLL_MS)
+
+    async def collect_async(self, page, timeout_ms):
+        if not self.inbox:
+            self.attempt += 1
+            self.pushed_at = time.time()
+            # input() would stall every other coroutine, so the prompt runs in a thread
+            text = await asyncio.to_thread(self.prompt, page)
+            self.answered_at = time.time()
+            return text
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            text = self.take_answer()
+            if text is not None:
+                return text
+            if time.monotonic() > deadline:
+                raise self.timed_out(timeout_ms)
+            await asyncio.sleep(CAPTCHA_POLL_MS / 1000)
+
+    def report(self, accepted, outcome=None):
+        """Record the attempt: accepted True/False, or None when the outcome is unknown."""
+        if outcome is None:
+            outcome = {True: 'accepted', False: 'rejected', None: 'unknown'}[accepted]
+        latency = round(self.answered_at - self.pushed_at, 2) if self.answered_at and self.pushed_at else None
+        record_attempt(self.stats_path, record_id=self.record_id, request_id=self.request_id, mode=self.mode,
+                       attempt=self.attempt, latency_s=latency, outcome=outcome)
+        if self.inbox and self.request_id:
+            self.inbox.remove(self.request_id)
+        self.request_id = None
+        self.pushed_at = self.answered_at = None
+
+    def withdraw(self):
+        """Take a still pending captcha out of the inbox, e.g. when the run gives up or starts over."""
+        if self.inbox and self.request_id:
+            self.report(None, outcome='withdrawn')
+
+def new_handoff(prompt, record_id=None):
+    """The handoff for a run in the configured AUTOFORM_CAPTCHA_MODE."""
+    inbox = CaptchaInbox() if CAPTCHA_MODE == 'inbox' else None
+    return CaptchaHandoff(inbox, prompt, record_id)
+
+def watch(inbox, interval=1.0):
+    """Operator console: show each new captcha and pass the typed answer to the waiting run."""
+    print(f"Watching {inbox.directory} for captchas (Ctrl+C to stop).")
+    seen = set()
+    try:
+        while True:
+            for request in inbox.pending():
+                if request['id'] in seen:
+                    continue
+                seen.add(request['id'])
+                record = f" for record {request['record_id']}" if request.get('record_id') else ''
+                print(f"\nCaptcha {request['id']}{record} (attempt {request['attempt']}): {request['image']}")
+                text = input("Text shown in the image (empty to skip): ").strip()
+                if text:
+                    try:
+                        inbox.answer(request['id'], text)
+                    except KeyError:
+                        print("That captcha was withdrawn in the meantime.")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def print_stats(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        print(f"No captcha attempts recorded in {path}.")
+        return
+    outcomes = {}
+    for entry in entries:
+        outcomes[entry['outcome']] = outcomes.get(entry['outcome'], 0) + 1
+    decided = outcomes.get('accepted', 0) + outcomes.get('rejected', 0)
+    print(f"{len(entries)} captcha attempt(s): " + ", ".join(f"{n} {name}" for name, n in sorted(outcomes.items())))
+    if decided:
+        print(f"Accept rate: {outcomes.get('accepted', 0) / decided:.0%} of {decided} submitted")
+    latencies = sorted(e['latency_s'] for e in entries if e.get('latency_s') is not None)
+    if latencies:
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+        print(f"Operator latency: median {statistics.median(latencies):.1f} s, p90 {p90:.1f} s, "
+              f"max {latencies[-1]:.1f} s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Answer the bot's captchas and see how long that takes.")
+    parser.add_argument('--inbox', default=CAPTCHA_INBOX_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('watch', help="Prompt for every new captcha as it arrives")
+    subparsers.add_parser('list', help="List the captchas waiting for an answer")
+    answer_parser = subparsers.add_parser('answer', help="Answer one captcha")
+    answer_parser.add_argument('request_id')
+    answer_parser.add_argument('text')
+    stats_parser = subparsers.add_parser('stats', help="Latency and accept rate per attempt")
+    stats_parser.add_argument('--file', default=CAPTCHA_STATS_FILE)
+    args = parser.parse_args()
+
+    inbox = CaptchaInbox(args.inbox)
+    if args.command == 'watch':
+        watch(inbox)
+    elif args.command == 'list':
+        for request in inbox.pending():
+            print(f"{request['id']}  record={request.get('record_id') or '-'}  attempt={request['attempt']}  "
+                  f"waiting {time.time() - request['created']:.0f} s  {request['image']}")
+    elif args.command == 'answer':
+        inbox.answer(args.request_id, args.text)
+    else:
+        print_stats(args.file)
@@ -0,0 +1,198 @@
+import os
+
+from logs import get_logger
+from option_cache import SELECT_OPTIONS_JS, select_option_cache
+
+log = get_logger('form_fill')
+
+# Set AUTOFORM_BATCH_FILL=0 to fill every field with its own Playwright call
+BATCH_FILL = os.environ.get('AUTOFORM_BATCH_FILL', '1') != '0'
+
+GENDER_RADIOS = {'male': '#gender_male', 'female': '#gender_female', 'other': '#gender_other'}
+
+# data.json key -> (selector, control type) for each request-form section, in fill order.
+# Radio fields map the lowercased value to the radio to check, with 'other' as the fallback.
+FORM_SECTIONS = {
+    'demographic': [
+        ('last_name', '#last_name', 'text'),
+        ('first_name', '#first_name', 'text'),
+        ('gender', GENDER_RADIOS, 'radio'),
+        ('dob_ad', '#dob_ad', 'text'),
+        ('dob_bs', '#dob_bs', 'text'),
+        ('place_of_birth_district', '#place_of_birth_district', 'select'),
+        ('birth_country', '#birth_country', 'select'),
+        ('nationality', '#nationality', 'select'),
+        ('father_last_name', '#father_last_name', 'text'),
+        ('father_first_name', '#father_first_name', 'text'),
+        ('mother_last_name', '#mother_last_name', 'text'),
+        ('mother_first_name', '#mother_first_name', 'text'),
+    ],
+    'citizenship': [
+        ('nin', '#nin', 'text'),
+        ('citizenship_number', '#citizenship_number', 'text'),
+        ('citizenship_issue_date_bs', '#citizenship_issue_date_bs', 'text'),
+        ('citizenship_issue_district', '#citizenship_issue_district', 'select'),
+    ],
+    'applicant_contact': [
+        ('mobile_number', '#mobile_number', 'text'),
+        ('email', '#email', 'text'),
+        ('main_address_house_number', '#main_address_house_number', 'text'),
+        ('main_address_street', '#main_address_street', 'text'),
+        ('main_address_ward', '#main_address_ward', 'text'),
+        ('main_address_country', '#main_address_country', 'select'),
+        ('main_address_province', '#main_address_province', 'select'),
+        ('main_address_district', '#main_address_district', 'select'),
+        ('main_address_municipality', '#main_address_municipality', 'select'),
+    ],
+    'emergency_contact': [
+        ('emergency_contact_last_name', '#emergency_last_name', 'text'),
+        ('emergency_contact_first_name', '#emergency_first_name', 'text'),
+        ('emergency_contact_house_number', '#emergency_house_number', 'text'),
+        ('emergency_contact_street', '#emergency_street', 'text'),
+        ('emergency_contact_ward', '#emergency_ward', 'text'),
+        ('emergency_contact_province', '#emergency_province', 'select'),
+        ('emergency_contact_district', '#emergency_district', 'select'),
+        ('emergency_contact_municipality', '#emergency_municipality', 'select'),
+        ('emergency_contact_country', '#emergency_country', 'select'),
+        ('emergency_contact_phone', '#emergency_phone', 'text'),
+        ('emergency_contact_email', '#emergency_email', 'text'),
+    ],
+}
+
+# Sets every field of a section in one go. Values go through the native setters and
+# are followed by the input/change/blur events Angular's form controls listen to.
+# Fields that cannot be set (missing element, unknown option) are reported back.
+BATCH_FILL_JS = """
+fields => {
+    const failed = [];
+    const fire = (el, type) => el.dispatchEvent(new Event(type, {bubbles: true}));
+    for (const field of fields) {
+        const el = document.querySelector(field.selector);
+        if (!el || el.disabled) {
+            failed.push({selector: field.selector, reason: el ? 'disabled' : 'not found'});
+            continue;
+        }
+        if (field.kind === 'text') {
+            const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+            el.focus();
+            Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, field.value);
+            fire(el, 'input');
+            fire(el, 'change');
+            el.blur();
+        } else if (field.kind === 'select') {
+            const wanted = field.value.trim();
+            const option = Array.from(el.options).find(o => o.label.trim() === wanted || o.text.trim() === wanted);
+            if (!option) {
+                failed.push({selector: field.selector, reason: 'option not found'});
+                continue;
+            }
+            el.value = option.value;
+            fire(el, 'input');
+            fire(el, 'change');
+        } else if (field.kind === 'radio') {
+            if (!el.checked) el.click();
+        }
+    }
+    return failed;
+}
+"""
+
+# Returns the selectors whose current value does not match the plan
+VERIFY_FILL_JS = """
+fields => fields.filter(field => {
+    const el = document.querySelector(field.selector);
+    if (!el) return true;
+    if (field.kind === 'radio') return !el.checked;
+    if (field.kind === 'select') {
+        const option = el.options[el.selectedIndex];
+        return !option || option.text.trim() !== field.value.trim();
+    }
+    return el.value !== field.value;
+}).map(field => field.selector)
+"""
+
+def build_fill_plan(section, data):
+    """
+    Resolve a section of FORM_SECTIONS against the applicant data into a list of
+    {'key', 'selector', 'kind', 'value'} entries. Raises KeyError for a missing key.
+    """
+    plan = []
+    for key, selector, kind in FORM_SECTIONS[section]:
+        value = data[key]
+        if kind == 'radio':
+            selector = selector.get(value.lower(), selector['other'])
+        plan.append({'key': key, 'selector': selector, 'kind': kind, 'value': value})
+    return plan
+
+def field_action(field):
+    """The page method name and arguments that fill a single field with the regular Playwright action for its control type."""
+    if field['kind'] == 'text':
+        return 'fill', (field['selector'], field['value']), {}
+    if field['kind'] == 'select':
+        return 'select_option', (field['selector'],), {'label': field['value']}
+    return 'check', (field['selector'],), {}
+
+def fill_field(page, field):
+    """Fill a single field with the regular Playwright action for its control type."""
+    method, args, kwargs = field_action(field)
+    getattr(page, method)(*args, **kwargs)
+
+def unverified_fields(plan, failed):
+    """The plan's fields left for the read-back: those the batch script did not report as failed."""
+    return [field for field in plan if field['selector'] not in {item['selector'] for item in failed}]
+
+def fields_to_refill(plan, failed, mismatched):
+    """The plan's fields the batch script could not set or that read back differently, in plan order."""
+    retry = {item['selector'] for item in failed} | set(mismatched)
+    fields = [field for field in plan if field['selector'] in retry]
+    for field in fields:
+        log.info(f"Batch fill did not take for {field['key']} ({field['selector']}), filling it directly.")
+    return fields
+
+def fill_plan(page, plan):
+    """
+    Fill a resolved plan with one injected script and verify it with one read-back.
+    Fields the script could not set, or that read back differently (e.g. a dependent
+    dropdown whose options load asynchronously), are retried one by one with Playwright.
+    """
+    if not BATCH_FILL:
+        fields = plan
+    else:
+        page.wait_for_selector(plan[0]['selector'], state="attached")
+        failed = page.evaluate(BATCH_FILL_JS, plan)
+        fields = fields_to_refill(plan, failed, page.evaluate(VERIFY_FILL_JS, unverified_fields(plan, failed)))
+    for field in fields:
+        fill_field(page, field)
+    if select_fields(plan):
+        try:
+            remember_select_options(plan, page.evaluate(SELECT_OPTIONS_JS, select_fields(plan)))
+        except Exception as e:
+            log.debug(f"Could not read select options: {e}")
+
+def select_fields(plan):
+    return [field['selector'] for field in plan if field['kind'] == 'select']
+
+def remember_select_options(plan, labels_by_selector):
+    """Cache the option lists read from the plan's selects, as filled, for validating later records."""
+    select_option_cache.record(plan, labels_by_selector)
+
+async def fill_field_async(page, field):
+    """fill_field for an async API page."""
+    method, args, kwargs = field_action(field)
+    await getattr(page, method)(*args, **kwargs)
+
+async def fill_plan_async(page, plan):
+    """fill_plan for an async API page: same batch script, read-back and per-field fallback."""
+    if not BATCH_FILL:
+        fields = plan
+    else:
+        await page.wait_for_selector(plan[0]['selector'], state="attached")
+        failed = await page.evaluate(BATCH_FILL_JS, plan)
+        fields = fields_to_refill(plan, failed, await page.evaluate(VERIFY_FILL_JS, unverified_fields(plan, failed)))
+    for field in fields:
+        await fill_field_async(page, field)
+    if select_fields(plan):
+        try:
+            remember_select_options(plan, await page.evaluate(SELECT_OPTIONS_JS, select_fields(plan)))
+        except Exception as e:
+            log.debug(f"Could not read select options: {e}")
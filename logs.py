@@ -0,0 +1,140 @@
+"""
+Logging for the bot, plus a bounded store for DOM snapshots.
+
+AUTOFORM_LOG_LEVEL sets the level (DEBUG, INFO, WARNING, ...; default INFO) and
+AUTOFORM_LOG_FILE additionally appends the log to a file. Page HTML is never
+written into the log: snapshots are hashed, stored gzipped under
+AUTOFORM_SNAPSHOT_DIR only when they changed, and the log line links the file.
+They are only taken when their level is enabled, so at INFO the routine ones
+cost nothing.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+LOG_LEVEL = os.environ.get('AUTOFORM_LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('AUTOFORM_LOG_FILE', '')
+SNAPSHOT_DIR = os.environ.get('AUTOFORM_SNAPSHOT_DIR', os.path.join('artifacts', 'dom'))
+# Larger pages are cut at this many bytes before compression
+SNAPSHOT_MAX_BYTES = int(os.environ.get('AUTOFORM_SNAPSHOT_MAX_BYTES', str(512 * 1024)))
+# The oldest snapshots are deleted beyond this many files
+SNAPSHOT_MAX_FILES = int(os.environ.get('AUTOFORM_SNAPSHOT_MAX_FILES', '200'))
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(message)s'
+
+_configured = False
+_configure_lock = threading.Lock()
+
+def get_logger(name):
+    """Logger for a module of the bot; the first call sets up the handlers."""
+    global _configured
+    with _configure_lock:
+        if not _configured:
+            root = logging.getLogger('autoform')
+            root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+            handlers = [logging.StreamHandler()]
+            if LOG_FILE:
+                handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+            for handler in handlers:
+                handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt='%H:%M:%S'))
+                root.addHandler(handler)
+            root.propagate = False
+            _configured = True
+    return logging.getLogger(f'autoform.{name}')
+
+log = get_logger('snapshots')
+
+class SnapshotStore:
+    """
+    Content-addressed, gzipped HTML snapshots. A snapshot identical to the previous one
+    under the same label is not stored again, identical pages share one file, and the
+    directory is trimmed to the newest max_files entries.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, max_bytes=SNAPSHOT_MAX_BYTES, max_files=SNAPSHOT_MAX_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def store(self, html, label):
+        """Store html and return (path, changed); changed is False when label's last snapshot was the same."""
+        body = html.encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        path = os.path.join(self.directory, digest + '.html.gz')
+        with self.lock:
+            if self.last.get(label) == digest:
+                return path, False
+            self.last[label] = digest
+            if os.path.exists(path):
+                # Touch it so rotation keeps snapshots that are still being referenced
+                os.utime(path)
+                return path, True
+            if len(body) > self.max_bytes:
+                body = body[:self.max_bytes] + f"\n<!-- truncated from {len(html)} characters -->".encode('utf-8')
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self.rotate()
+            return path, True
+
+    def rotate(self):
+        snapshots = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.html.gz')]
+        if len(snapshots) <= self.max_files:
+            return
+        snapshots.sort(key=os.path.getmtime)
+        for path in snapshots[:len(snapshots) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+snapshot_store = SnapshotStore()
+
+# outerHTML of the first element matching the selector, or of the whole document
+SNAPSHOT_JS = """
+selector => {
+    const el = selector ? document.querySelector(selector) : null;
+    return (el || document.documentElement).outerHTML;
+}
+"""
+
+def log_snapshot(html, label, level):
+    try:
+        path, changed = snapshot_store.store(html, label)
+    except OSError as e:
+        log.warning(f"Could not store DOM snapshot for {label}: {e}")
+        return None
+    log.log(level, f"{label}: DOM snapshot {path} ({len(html) // 1024} KiB{'' if changed else ', unchanged'})")
+    return path
+
+def dom_snapshot(page, label, selector=None, level=logging.DEBUG):
+    """
+    Snapshot the element matching selector (the whole page when there is none) if level
+    is enabled, and log a link to it. Returns the snapshot path or None.
+    """
+    if not log.isEnabledFor(level):
+        return None
+    try:
+        html = page.evaluate(SNAPSHOT_JS, selector)
+    except Exception as e:
+        log.warning(f"Could not read the DOM for {label}: {e}")
+        return None
+    return log_snapshot(html, label, level)
+
+async def dom_snapshot_async(page, label, selector=None, level=logging.DEBUG):
+    """dom_snapshot() for an async API page."""
+    if not log.isEnabledFor(level):
+        return None
+    try:
+        html = await page.evaluate(SNAPSHOT_JS, selector)
+    except Exception as e:
+        log.warning(f"Could not read the DOM for {label}: {e}")
+        return None
+    return log_snapshot(html, label, level)
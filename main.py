@@ -1,7 +1,109 @@
 from playwright.sync_api import sync_playwright
+import calendar
 import json
-import time
-from datetime import datetime, timedelta
+import logging
+import os
+from datetime import date, datetime
+
+from captcha_inbox import new_handoff
+from form_fill import FORM_SECTIONS, fill_plan
+from logs import dom_snapshot, get_logger
+from routing import PROFILE, install_routing
+from selector_cache import selector_registry
+from session import LOGIN_LINK_SELECTOR, BrowserSession
+from slot_preferences import load_preferences
+from slots import SlotCapture, normalize_time
+from tracing import Tracer, set_tracer, span, traced
+from validation import InvalidRecord, compile_fill_plans, prepare_record
+
+log = get_logger('main')
+
+# Portal root; point it at mock_portal/server.py to run the flow offline
+BASE_URL = os.environ.get('PASSPORT_BASE_URL', 'https://emrtds.nepalpassport.gov.np/')
+HEADLESS = os.environ.get('AUTOFORM_HEADLESS', '') == '1'
+STATUS_FILE = os.environ.get('AUTOFORM_STATUS_FILE', 'status.json')
+BATCH_ARTIFACTS_DIR = os.environ.get('AUTOFORM_BATCH_ARTIFACTS_DIR', 'batch_artifacts')
+
+# Spans for every step, form section, calendar month and attempt are appended here as JSON lines
+TRACE_FILE = os.environ.get('AUTOFORM_TRACE_FILE', 'trace.jsonl')
+# Set to a .zip path to also record a Playwright trace (open with `playwright show-trace`)
+PLAYWRIGHT_TRACE = os.environ.get('AUTOFORM_PLAYWRIGHT_TRACE', '')
+
+# Set AUTOFORM_DEBUG=1 to pause on the appointment calendar for manual inspection
+DEBUG = os.environ.get('AUTOFORM_DEBUG', '') == '1'
+INSPECTION_PAUSE_MS = int(os.environ.get('AUTOFORM_INSPECTION_PAUSE_MS', '30000'))
+# 'dom' scrapes the rendered calendar; 'network' picks the slot from the JSON the calendar downloads
+SLOT_SOURCE = os.environ.get('AUTOFORM_SLOT_SOURCE', 'dom')
+
+# Upper bounds (ms) for each wait; a wait returns as soon as its condition holds.
+# AUTOFORM_TIMEOUT_SCALE stretches all of them for slow links.
+TIMEOUT_SCALE = float(os.environ.get('AUTOFORM_TIMEOUT_SCALE', '1'))
+STEP_TIMEOUTS = {
+    'default': 15000,
+    'navigation': 30000,
+    'request_service': 20000,
+    'passport_type': 15000,
+    'proceed': 30000,
+    'terms': 15000,
+    'appointment': 30000,
+    'dropdown': 10000,
+    'calendar': 15000,
+    'month_change': 5000,
+    'time_slots': 10000,
+    'slot_data': 10000,
+    'request_form': 30000,
+    'captcha_image': 10000,
+    # How long a run waits for the operator to answer a captcha, and for the portal to judge it
+    'captcha_answer': 300000,
+    'captcha_result': 15000,
+    'screenshot': 10000,
+}
+
+def step_timeout(step):
+    """Timeout in milliseconds for the given step name."""
+    return int(STEP_TIMEOUTS.get(step, STEP_TIMEOUTS['default']) * TIMEOUT_SCALE)
+
+def wait_for_selector_state(page, selector, state="visible", step='default'):
+    """Wait until the selector reaches the given state (attached/detached/visible/hidden)."""
+    return page.wait_for_selector(selector, state=state, timeout=step_timeout(step))
+
+# With the lean profile navigations only wait for the DOM; each page then waits for its own readiness signal
+NAVIGATION_WAIT = 'load' if PROFILE == 'full' else 'domcontentloaded'
+PAGE_READY_SELECTORS = {
+    'home': f':text-is("First Issuance"), {LOGIN_LINK_SELECTOR}',
+    'request_service': 'label:has-text("Ordinary 34 pages")',
+    'appointment': '#mat-select-0',
+    'request_form': '#last_name, #nin, #mobile_number, #emergency_last_name',
+}
+FORM_SECTION_ORDER = ['demographic', 'citizenship', 'applicant_contact', 'emergency_contact']
+
+def wait_for_url(page, url, step='default'):
+    """Wait until the page has navigated to the given URL (string, glob or regex)."""
+    page.wait_for_url(url, wait_until=NAVIGATION_WAIT, timeout=step_timeout(step))
+
+def wait_until_ready(page, page_name, step='default'):
+    """Wait for the element that shows the given portal page is usable."""
+    return wait_for_selector_state(page, PAGE_READY_SELECTORS[page_name], step=step)
+
+# Marks window.__autoformMutated once anything under the observed element changes
+DOM_OBSERVER_JS = """
+el => {
+    window.__autoformMutated = false;
+    if (window.__autoformObserver) window.__autoformObserver.disconnect();
+    const target = el.parentElement || el;
+    window.__autoformObserver = new MutationObserver(() => {
+        window.__autoformMutated = true;
+        window.__autoformObserver.disconnect();
+    });
+    window.__autoformObserver.observe(target, {childList: true, subtree: true, characterData: true, attributes: true});
+}
+"""
+
+def wait_for_dom_mutation(page, selector, action, step='default'):
+    """Run action and wait until the DOM around the selector has mutated."""
+    page.eval_on_selector(selector, DOM_OBSERVER_JS)
+    action()
+    page.wait_for_function('() => window.__autoformMutated === true', timeout=step_timeout(step))
 
 def solve_captcha(page):
     """
@@ -10,412 +112,881 @@ def solve_captcha(page):
     print("Please enter the captcha text manually (automation limited, provide text from image):")
     return input()
 
-def is_date_available(page, target_day, month_index=0):
+# Selectors shared by the sync and async engines
+CALENDAR_SELECTOR = 'table.ui-datepicker-calendar'
+NEXT_MONTH_SELECTOR = '.ui-datepicker-next-icon.pi.pi-chevron-right'
+PREV_MONTH_SELECTOR = '.ui-datepicker-prev-icon.pi.pi-chevron-left'
+NO_SLOTS_SELECTOR = 'text="There are no available slots at the moment"'
+TIME_CHIP_LIST_SELECTOR = 'mat-chip-list'
+TIME_SLOT_SELECTOR = 'mat-chip:not(.mat-chip-disabled)'
+PASSPORT_RADIO_SELECTOR = 'input[type="radio"] + label:has-text("Ordinary 34 pages")'
+PASSPORT_RADIO_CHECKED_SELECTOR = 'input[type="radio"]:checked + label:has-text("Ordinary 34 pages")'
+AGREE_SELECTOR = 'a:has-text("I agree स्वीकृत छ")'
+# Either the terms modal opens or the portal bounces back to the home page
+AFTER_PROCEED_SELECTOR = f'{AGREE_SELECTOR}, :text("First Issuance")'
+GENERIC_DATE_TRIGGER_SELECTOR = 'form mat-form-field, form button, form input'
+CAPTCHA_NEXT_SELECTOR = 'button:has-text("Next")'
+CAPTCHA_ERROR_SELECTOR = '#appointment-error, mat-error, snack-bar-container, [role="alert"]'
+FORM_NEXT_SELECTOR = 'text="Next"'
+# Replaces the form once the last section has been submitted
+FORM_SUBMITTED_SELECTOR = ':text("Review your application")'
+
+# Reads every day cell of the rendered month in one round-trip.
+# Available dates have an <a> tag with draggable="false"; unavailable dates
+# are a span with ui-state-disabled. Days belonging to the neighbouring
+# months are skipped so they do not shadow the current month's entries.
+CALENDAR_SNAPSHOT_JS = """
+table => {
+    const days = {};
+    for (const td of table.querySelectorAll('td')) {
+        if (td.classList.contains('ui-datepicker-other-month')) continue;
+        const link = td.querySelector('a[draggable="false"]');
+        const disabled = td.querySelector('span.ui-state-disabled');
+        const text = (link || disabled || td).textContent.trim();
+        if (!/^\\d{1,2}$/.test(text)) continue;
+        if (link && !link.classList.contains('ui-state-disabled') && !link.hasAttribute('disabled')) {
+            days[text] = 'available';
+        } else {
+            days[text] = 'disabled';
+        }
+    }
+    const title = document.querySelector('.ui-datepicker-title');
+    return {title: title ? title.textContent.trim() : '', days: days};
+}
+"""
+
+# Watches for an error message appearing after the captcha is submitted. A message that
+# was already on screen counts again once it is re-rendered, as after a second rejection.
+CAPTCHA_OUTCOME_JS = """
+errorSelector => {
+    window.__autoformCaptchaRejected = false;
+    if (window.__autoformCaptchaObserver) window.__autoformCaptchaObserver.disconnect();
+    const observer = new MutationObserver(() => {
+        const shown = Array.from(document.querySelectorAll(errorSelector))
+            .some(el => !el.hidden && el.offsetParent !== null && el.textContent.trim());
+        if (shown) window.__autoformCaptchaRejected = true;
+    });
+    observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+    window.__autoformCaptchaObserver = observer;
+}
+"""
+# True once the portal left the appointment page or showed an error; survives the navigation
+CAPTCHA_JUDGED_JS = """
+path => !window.location.pathname.replace(/\\/$/, '').endsWith(path) || window.__autoformCaptchaRejected === true
+"""
+
+def calendar_snapshot(raw, month_index=0):
     """
-    Check if a specific date is available in the current calendar view.
-    Available dates have an <a> tag with draggable="false".
+    Turn the result of CALENDAR_SNAPSHOT_JS into a dict with the month title and a map
+    of day number -> 'available' / 'disabled' / 'absent'.
     """
-    try:
-        # Wait for the calendar table to render
-        page.wait_for_selector('table.ui-datepicker-calendar', timeout=15000)
-        time.sleep(2)  # Extra delay to ensure rendering
-
-        # Log the calendar HTML for debugging
-        calendar_html = page.query_selector('table.ui-datepicker-calendar').inner_html()
-        print(f"Calendar HTML for month index {month_index}:\n{calendar_html}")
-
-        # Selector for available date (td containing a with draggable="false")
-        date_cell_selector = f'td a[draggable="false"]:text-is("{target_day}")'
-        available_date_elements = page.locator(date_cell_selector).all()
-
-        print(f"Found {len(available_date_elements)} elements for day {target_day} with <a> tag and draggable='false'.")
-        for date_element in available_date_elements:
-            if date_element.is_enabled():
-                print(f"Date {target_day} is available in month index {month_index}.")
-                return date_element
-
-        # Check for unavailable dates (span with ui-state-disabled)
-        unavailable_selector = f'td span.ui-state-disabled:text-is("{target_day}")'
-        unavailable_elements = page.locator(unavailable_selector).all()
-        if unavailable_elements:
-            print(f"Date {target_day} is unavailable in month index {month_index}.")
-        else:
-            print(f"Date {target_day} not found in month index {month_index}.")
+    days = {day: 'absent' for day in range(1, 32)}
+    for day, state in raw['days'].items():
+        days[int(day)] = state
+    log.debug(f"Calendar snapshot for month index {month_index} ({raw['title'] or 'untitled'}): "
+              f"{sum(1 for s in days.values() if s == 'available')} available day(s).")
+    return {'title': raw['title'], 'month_index': month_index, 'days': days}
 
-        return None
-    except Exception as e:
-        print(f"Error checking date availability for day {target_day}: {e}")
-        return None
+def snapshot_calendar(page, month_index=0):
+    """Capture the state of every day in the current calendar view with a single page.evaluate call."""
+    wait_for_selector_state(page, CALENDAR_SELECTOR, step='calendar')
+    return calendar_snapshot(page.eval_on_selector(CALENDAR_SELECTOR, CALENDAR_SNAPSHOT_JS), month_index)
 
-def go_to_next_month(page):
-    """Navigate to the next month in the date picker."""
+def index_calendar(snapshot):
+    """Build an in-memory index of state -> sorted list of days from a calendar snapshot."""
+    index = {'available': [], 'disabled': [], 'absent': []}
+    for day in sorted(snapshot['days']):
+        index[snapshot['days'][day]].append(day)
+    return index
+
+def click_calendar_day(page, day):
+    """Click the available <a> for the given day in the current calendar view."""
+    page.locator(f'{CALENDAR_SELECTOR} td a[draggable="false"]:text-is("{day}")').first.click()
+
+def change_month(page, button_selector, label):
+    """Click the date picker's next/previous month button and wait for the calendar to re-render."""
     try:
-        # Ensure the next button is visible
-        next_button_selector = '.ui-datepicker-next-icon.pi.pi-chevron-right'
-        page.wait_for_selector(next_button_selector, state="visible", timeout=5000)
-        next_button = page.query_selector(next_button_selector)
-        if next_button and next_button.is_visible():
-            next_button.click()
-            print("Clicked 'Next month' button.")
-            time.sleep(2)  # Wait for the next month to load
+        # Ensure the button is visible
+        wait_for_selector_state(page, button_selector, step='month_change')
+        button = page.query_selector(button_selector)
+        if button and button.is_visible():
+            # Returns once the calendar has re-rendered with the other month
+            wait_for_dom_mutation(page, CALENDAR_SELECTOR, button.click, step='month_change')
+            log.debug(f"Clicked '{label}' button.")
             return True
         else:
-            print("Next month button not found or not visible.")
+            log.warning(f"{label} button not found or not visible.")
             return False
     except Exception as e:
-        print(f"Error navigating to next month: {e}")
+        log.warning(f"Error navigating to {label.lower()}: {e}")
         return False
 
-def check_for_available_date(page):
+MONTH_BUTTONS = {
+    'next': (NEXT_MONTH_SELECTOR, 'Next month'),
+    'previous': (PREV_MONTH_SELECTOR, 'Previous month'),
+}
+
+def go_to_next_month(page):
+    """Navigate to the next month in the date picker."""
+    return change_month(page, *MONTH_BUTTONS['next'])
+
+def reopen_date_picker(page):
+    """Reopen the date picker after a day click has closed it."""
+    _, date_input = selector_registry.resolve(page, 'date_input')
+    if date_input:
+        date_input.click()
+        wait_for_selector_state(page, CALENDAR_SELECTOR, step='calendar')
+        log.debug("Reopened date picker.")
+    else:
+        log.warning("Could not reopen date picker.")
+        raise Exception("Failed to reopen date picker to continue the date search.")
+
+MONTH_NAMES = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+               'august', 'september', 'october', 'november', 'december']
+
+def parse_calendar_title(title):
+    """Return (year, month) from a datepicker title such as 'June 2025', or None."""
+    words = title.lower().replace(',', ' ').split()
+    month = next((MONTH_NAMES.index(w) + 1 for w in words if w in MONTH_NAMES), None)
+    year = next((int(w) for w in words if w.isdigit() and len(w) == 4), None)
+    if month is None or year is None:
+        return None
+    return year, month
+
+def add_months(year, month, count):
+    """(year, month) count months after the given one."""
+    months = year * 12 + month - 1 + count
+    return months // 12, months % 12 + 1
+
+def allowed_calendar_days(snapshot, year, month, preferences):
+    """The available days of a month snapshot that the preferences allow, as dates."""
+    days = (date(year, month, day) for day in index_calendar(snapshot)['available']
+            if day <= calendar.monthrange(year, month)[1])
+    return [day for day in days if preferences.date_allowed(day)]
+
+MAX_MONTHS_TO_CHECK = 7
+
+class CalendarScan:
     """
-    Iterate through dates starting from the current date (May 23, 2025) and future months.
-    Select the first available date with available time slots.
-    Checks all days in the current month before moving to the next.
+    The decisions of a month-by-month calendar scan, shared by both engines: which month
+    a snapshot belongs to, the allowed dates seen so far, and whether a later month could
+    still hold a better one. The engines only read the months and move the picker.
     """
-    print("Attempting to select an available appointment date.")
-    date_selected = False
-    max_months_to_check = 7
 
-    # Start from the current date (May 23, 2025)
-    current_date = datetime.now()
-    start_day = current_date.day  # Start from today (23rd)
-    max_days_in_month = 31  # Maximum days to check per month
+    def __init__(self, preferences, max_months=MAX_MONTHS_TO_CHECK):
+        self.preferences = preferences
+        self.max_months = max_months
+        self.months_read = 0
+        # (year, month) of the last month read
+        self.shown = None
+        self.candidates = []
 
-    for month_advance_count in range(max_months_to_check):
-        print(f"Checking month (iteration {month_advance_count + 1} of {max_months_to_check})")
+    def expected_month(self):
+        """The month the picker should show next: the current month first, then one after another."""
+        if self.shown:
+            return add_months(*self.shown, 1)
+        return self.preferences.today.year, self.preferences.today.month
 
-        # Check for "no available slots" message
-        no_slots_message_locator = page.locator('text="There are no available slots at the moment"')
-        if no_slots_message_locator.is_visible(timeout=2000):
-            print(f"No slots available in the current calendar view. Clicking 'Next month'.")
-            if not go_to_next_month(page):
-                raise Exception("Failed to navigate to the next month.")
-            continue
+    def add_month(self, snapshot, no_slots=False):
+        """
+        Record the month on screen from its snapshot. With no_slots (the picker says there
+        are none) its days are skipped, and snapshot is None if no calendar was shown to
+        read the month from.
+        """
+        log.debug(f"Checking month (iteration {self.months_read + 1} of {self.max_months})")
+        year, month = self.expected_month()
+        if snapshot is not None:
+            year, month = parse_calendar_title(snapshot['title']) or (year, month)
+        if no_slots or snapshot is None:
+            log.debug(f"No slots available in {year}-{month:02d}.")
+        else:
+            days = allowed_calendar_days(snapshot, year, month, self.preferences)
+            log.debug(f"Allowed available days in {year}-{month:02d}: {[day.day for day in days]}")
+            self.candidates.extend(days)
+        self.shown = (year, month)
+        self.months_read += 1
 
-        # Determine the starting day for the current month
-        start_day_of_search = start_day if month_advance_count == 0 else 1
-
-        # Iterate through all days in the current month
-        days_checked = []
-        for day_to_check in range(start_day_of_search, max_days_in_month + 1):
-            days_checked.append(day_to_check)
-            available_date = is_date_available(page, str(day_to_check), month_index=month_advance_count)
-            if available_date:
-                try:
-                    available_date.click()
-                    print(f"Selected date: {day_to_check} in month index {month_advance_count}")
-                    
-                    # Check if time slots are available for the selected date
-                    time_slot_selector = 'mat-chip:not(.mat-chip-disabled)'
-                    page.wait_for_selector('mat-chip-list', state="visible", timeout=5000)
-                    available_time_slots = page.locator(time_slot_selector).all()
-                    if not available_time_slots:
-                        print(f"No available time slots for date {day_to_check}. Moving to next month.")
-                        # Reopen the date picker to navigate to the next month
-                        date_input = page.query_selector('input[formcontrolname="appointmentDate"]')
-                        if date_input and date_input.is_visible():
-                            date_input.click()
-                            print("Reopened date picker to navigate to next month.")
-                        else:
-                            print("Could not reopen date picker.")
-                            raise Exception("Failed to reopen date picker to navigate to next month.")
-                        break  # Break the day loop to move to the next month
-                    else:
-                        date_selected = True
-                        break  # Exit the day loop since we found a date with available time slots
-                except Exception as e:
-                    print(f"Error selecting date {day_to_check}: {e}")
-            print(f"Checked day {day_to_check} in month index {month_advance_count}")
-
-        if date_selected:
-            print(f"Available date found after checking days: {days_checked}")
-            break
+    def wants_more(self):
+        """False once the month limit is reached or later months cannot hold a better date than one seen."""
+        if self.months_read >= self.max_months:
+            return False
+        bound = self.preferences.best_score_from(date(*add_months(*self.shown, 1), 1))
+        if bound is None:
+            return False
+        return not self.candidates or max(self.preferences.date_score(day) for day in self.candidates) < bound
+
+    def take_candidates(self):
+        """The allowed dates seen since the last call, best first."""
+        candidates, self.candidates = self.candidates, []
+        return self.preferences.rank_dates(candidates)
+
+    def resume_month(self):
+        """
+        (year, month) to go on scanning from once every date taken has failed, or None
+        when the month limit is reached or no later date can be allowed.
+        """
+        if self.months_read >= self.max_months:
+            return None
+        year, month = add_months(*self.shown, 1)
+        if self.preferences.best_score_from(date(year, month, 1)) is None:
+            return None
+        return year, month
 
-        print(f"No available dates found after checking days {days_checked} in month index {month_advance_count}. Clicking 'Next month'.")
+def scan_calendar(page, scan, first_snapshot=None):
+    """
+    Read the open date picker into scan month by month, one snapshot each, and return
+    the dates the preferences allow, best first. first_snapshot stands in for reading
+    the month on screen when the caller already has it.
+    """
+    log.debug("Scanning the calendar for appointment dates.")
+    while True:
+        with span(f"Calendar month {scan.months_read + 1}", kind='month_scan'):
+            snapshot, first_snapshot = first_snapshot, None
+            no_slots = page.locator(NO_SLOTS_SELECTOR).is_visible()
+            if snapshot is None and (not no_slots or page.is_visible(CALENDAR_SELECTOR)):
+                snapshot = snapshot_calendar(page, month_index=scan.months_read)
+            scan.add_month(snapshot, no_slots)
+        if not scan.wants_more():
+            return scan.take_candidates()
         if not go_to_next_month(page):
             raise Exception("Failed to navigate to the next month.")
 
-    if not date_selected:
-        raise Exception("Failed to select an available date after checking multiple months.")
+MAX_MONTH_MOVES = 24
 
-    return date_selected
+def month_move(snapshot, year, month):
+    """
+    The way from the month in snapshot to the given one: 'here', 'next' or 'previous',
+    or None when the calendar title cannot be read.
+    """
+    shown = parse_calendar_title(snapshot['title'])
+    if shown is None:
+        log.warning("Could not read the calendar title.")
+        return None
+    if shown == (year, month):
+        return 'here'
+    return 'next' if shown < (year, month) else 'previous'
 
-def main():
+def go_to_month(page, year, month):
     """
-    Automates the process of filling out a passport pre-enrollment form.
+    Move the open date picker forwards or backwards until it shows the given month.
+    Returns the snapshot of that month, or None if it cannot be reached.
     """
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        page = browser.new_page()
-        
-        page.on("dialog", lambda dialog: dialog.accept())
-        
+    for _ in range(MAX_MONTH_MOVES):
+        snapshot = snapshot_calendar(page)
+        move = month_move(snapshot, year, month)
+        if move == 'here':
+            return snapshot
+        if move is None or not change_month(page, *MONTH_BUTTONS[move]):
+            return None
+    return None
+
+# Returns the text of every enabled time chip so the match happens locally
+TIME_CHIPS_JS = "chips => chips.filter(c => !c.classList.contains('mat-chip-disabled')).map(c => c.textContent.trim())"
+
+def time_chips(texts):
+    """Map 'HH:MM' -> chip text for the chip texts read with TIME_CHIPS_JS."""
+    chips = {}
+    for text in texts:
+        if normalize_time(text):
+            chips.setdefault(normalize_time(text), text)
+    return chips
+
+def read_time_chips(page):
+    """Map 'HH:MM' -> chip text for every enabled time chip, from one read of the chip list."""
+    wait_for_selector_state(page, TIME_CHIP_LIST_SELECTOR, step='time_slots')
+    return time_chips(page.eval_on_selector_all('mat-chip', TIME_CHIPS_JS))
+
+def day_selectable(snapshot, day):
+    """True if day is available in its month's snapshot; snapshot is None when the month could not be reached."""
+    if snapshot and day.day in index_calendar(snapshot)['available']:
+        return True
+    log.warning(f"Date {day.isoformat()} is not selectable in the calendar, skipping.")
+    return False
+
+def pick_time_chip(chips, preferences, day, times=None):
+    """Text of the chip with the best allowed time (limited to times when given), or None."""
+    time_value = preferences.best_time(t for t in chips if times is None or t in times)
+    if time_value is None:
+        log.warning(f"No allowed time offered on {day.isoformat()}.")
+        return None
+    return chips[time_value]
+
+def select_slot_on(page, day, preferences, times=None):
+    """
+    Pick day in the date picker, then the best allowed time among its enabled chips
+    (limited to times when given). Returns False when the day offers no such time.
+    """
+    if not page.is_visible(CALENDAR_SELECTOR):
+        reopen_date_picker(page)
+    if not day_selectable(go_to_month(page, day.year, day.month), day):
+        return False
+    click_calendar_day(page, day.day)
+    log.info(f"Selected date: {day.isoformat()}")
+
+    chip = pick_time_chip(read_time_chips(page), preferences, day, times)
+    if chip is None:
+        return False
+    page.locator(f'{TIME_SLOT_SELECTOR}:text-is("{chip}")').first.click()
+    log.info(f"Selected time: {chip}")
+    return True
+
+def choose_calendar_slot(page, preferences, first_snapshot=None):
+    """
+    Try the scanned dates best first until one offers an allowed time. The scan starts
+    at the current month whatever month the picker was left on (first_snapshot is that
+    month when the caller has already moved there). When no date offers an allowed time,
+    the scan goes on from the month after the last one read. Returns False once no month
+    is left to scan.
+    """
+    scan = CalendarScan(preferences)
+    month = scan.expected_month()
+    while True:
+        if first_snapshot is None:
+            if not page.is_visible(CALENDAR_SELECTOR):
+                reopen_date_picker(page)
+            first_snapshot = go_to_month(page, *month)
+            if first_snapshot is None:
+                return scan_unreachable(scan, month)
+        for day in scan_calendar(page, scan, first_snapshot):
+            try:
+                if select_slot_on(page, day, preferences):
+                    return True
+            except Exception as e:
+                log.warning(f"Error selecting date {day.isoformat()}: {e}")
+        month = scan.resume_month()
+        if month is None:
+            return False
+        log.info(f"No scanned date offered an allowed time, scanning on from {month[0]}-{month[1]:02d}.")
+        first_snapshot = None
+
+def scan_unreachable(scan, month):
+    """
+    The date picker could not be moved to month. Raises before anything was scanned,
+    since the dates of earlier months would be missed; later on the scan just ends.
+    """
+    if not scan.months_read:
+        raise Exception(f"Could not move the date picker to {month[0]}-{month[1]:02d}.")
+    log.warning(f"Could not move the date picker to {month[0]}-{month[1]:02d}, ending the scan.")
+    return False
+
+def captured_days(slot_capture, preferences):
+    """
+    Rank every captured (date, time) slot in one go. Returns [(day, times captured for it)]
+    for the days with an allowed slot, best first.
+    """
+    slots = [(date.fromisoformat(d), t) for d in slot_capture.dates_with_times() for t in slot_capture.times_for(d)]
+    ranked = preferences.rank_slots(slots)
+    log.info(f"Captured slot index has {len(ranked)} allowed slot(s) of {len(slots)} "
+             f"from {slot_capture.responses_seen} response(s).")
+    days = dict.fromkeys(day for day, _ in ranked)
+    return [(day, set(slot_capture.times_for(day.isoformat()))) for day in days]
+
+def select_slot_from_capture(page, slot_capture, preferences):
+    """
+    Confirm the best captured slot in the date picker. Returns False when no captured
+    slot could be confirmed so the caller can fall back to the DOM scan.
+    """
+    for day, times in captured_days(slot_capture, preferences):
+        if select_slot_on(page, day, preferences, times=times):
+            return True
+    return False
+
+def portal_url(path=''):
+    """Absolute URL of a portal page, e.g. portal_url('appointment')."""
+    return f"{BASE_URL.rstrip('/')}/{path}"
+
+def step_home(page, run):
+    page.goto(portal_url(), wait_until=NAVIGATION_WAIT, timeout=step_timeout('navigation'))
+    wait_until_ready(page, 'home', step='navigation')
+
+    login_required = page.query_selector('text="Log In"') or page.query_selector('text="Login"')
+    if login_required:
+        log.error("Login required, please log in manually.")
+        raise Exception("Login required, stopping for manual intervention.")
+
+def step_first_issuance(page, run):
+    page.click('text="First Issuance"')
+    wait_for_url(page, portal_url('request-service'), step='request_service')
+
+def step_passport_type(page, run):
+    wait_until_ready(page, 'request_service', step='passport_type')
+    is_selected = page.eval_on_selector(PASSPORT_RADIO_SELECTOR, 'element => element.previousElementSibling.checked')
+    if not is_selected:
+        page.click(PASSPORT_RADIO_SELECTOR)
+        log.info("Selected Ordinary 34 pages")
+    else:
+        log.debug("Ordinary 34 pages is already selected")
+    wait_for_selector_state(page, PASSPORT_RADIO_CHECKED_SELECTOR, state="attached", step='passport_type')
+
+def step_proceed(page, run):
+    wait_for_selector_state(page, selector_registry.combined('proceed'), step='proceed')
+    proceed_selector, proceed_button = selector_registry.resolve(page, 'proceed')
+    if not proceed_selector:
+        raise Exception("Proceed button not found.")
+    proceed_button.scroll_into_view_if_needed()
+
+    for click_attempt in range(3):
         try:
-            with open('data.json', 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            print("Error: data.json not found. Please create a data.json file with your form data.")
-            browser.close()
+            page.click(proceed_selector)
+            log.debug(f"Successfully clicked Proceed on attempt {click_attempt + 1}")
+            break
+        except Exception as e:
+            log.warning(f"Click attempt {click_attempt + 1} failed: {e}, retrying...")
+            wait_for_selector_state(page, proceed_selector, step='proceed')
+    else:
+        selector_registry.evict(page, 'proceed')
+        raise Exception("Failed to click Proceed button after 3 attempts")
+
+    wait_for_selector_state(page, AFTER_PROCEED_SELECTOR, step='proceed')
+
+    log.debug("Taking screenshot after clicking Proceed")
+    page.screenshot(path=artifact_path(run, 'post_proceed.png'))
+    dom_snapshot(page, "Page after clicking Proceed")
+
+    if page.url == portal_url():
+        log.warning("Detected redirect to homepage, attempting to restart...")
+        raise Exception("Redirected to the home page after clicking Proceed.")
+
+def step_terms(page, run):
+    wait_for_selector_state(page, AGREE_SELECTOR, step='terms')
+    page.click(AGREE_SELECTOR)
+    log.info("Clicked 'I agree' on the modal")
+
+def choose_option(page, select_selector, option_text):
+    """Pick option_text in a mat-select dropdown."""
+    page.click(select_selector)
+    wait_for_selector_state(page, 'mat-option', step='dropdown')
+    page.click(f'mat-option span:text("{option_text}")')
+    # The option panel closes once the selection has been applied
+    wait_for_selector_state(page, 'mat-option', state="hidden", step='dropdown')
+
+def open_date_picker(page):
+    """Trigger the date picker, trying the selector that worked last time first."""
+    log.debug("Attempting to trigger the date picker")
+    date_input_triggered = False
+    selector, date_input = selector_registry.resolve(page, 'date_input')
+    if date_input:
+        try:
+            date_input.click()
+            log.debug(f"Clicked date input using selector: {selector}")
+            date_input_triggered = True
+        except Exception as e:
+            log.warning(f"Failed to click selector {selector}: {e}")
+            selector_registry.evict(page, 'date_input')
+    if not date_input_triggered:
+        log.warning("No specific date input found, trying generic click on form fields")
+        try:
+            page.click(GENERIC_DATE_TRIGGER_SELECTOR, timeout=step_timeout('dropdown'))
+        except Exception as e:
+            log.warning(f"Generic click failed: {e}")
+
+    # Wait for the calendar to appear after triggering
+    log.debug("Waiting for the calendar to appear")
+    wait_for_selector_state(page, CALENDAR_SELECTOR, step='calendar')
+
+def select_appointment_slot(page, run, country, location):
+    """Choose the office and book the best slot it offers. Returns False if it offers no allowed slot."""
+    slot_capture = run.get('slot_capture')
+    if slot_capture:
+        # Slot data from a previously tried location must not be mixed in
+        slot_capture.reset()
+
+    log.info(f"Selecting appointment country as {country}")
+    choose_option(page, '#mat-select-0', country)
+    log.info(f"Selecting appointment location as {location}")
+    choose_option(page, '#mat-select-1', location)
+    open_date_picker(page)
+
+    dom_snapshot(page, f"Appointment form for {location}", 'form')
+
+    if DEBUG:
+        log.info(f"Pausing for {INSPECTION_PAUSE_MS // 1000} seconds to allow manual inspection...")
+        log.info("Inspect the calendar (e.g., right-click June 4 and select 'Inspect').")
+        page.wait_for_timeout(INSPECTION_PAUSE_MS)
+
+    preferences = run['preferences']
+    if slot_capture and slot_capture.wait_for_data(step_timeout('slot_data')):
+        if select_slot_from_capture(page, slot_capture, preferences):
+            return True
+    return choose_calendar_slot(page, preferences)
+
+def push_captcha(page, run):
+    """Hand the captcha over to the operator; a failure here only delays it until submission."""
+    try:
+        run['captcha'].push(page, step_timeout('captcha_image'))
+    except Exception as e:
+        log.warning(f"Could not hand over the captcha yet: {e}")
+
+def captcha_attempts(handoff):
+    """
+    The attempts of submit_captcha in both engines. The caller returns once an answer is
+    accepted; after CAPTCHA_MAX_ATTEMPTS rejected ones this raises instead.
+    """
+    for attempt in range(1, CAPTCHA_MAX_ATTEMPTS + 1):
+        log.info("Waiting for the captcha answer" if handoff.mode == 'inbox' else "Solving captcha")
+        yield attempt
+    raise Exception(f"Captcha rejected {CAPTCHA_MAX_ATTEMPTS} times.")
+
+def captcha_accepted(handoff, url, attempt):
+    """Judge a submitted answer by where the portal went and record it. True if it was accepted."""
+    if not on_portal_path(url, 'appointment'):
+        handoff.report(True)
+        return True
+    handoff.report(False)
+    log.warning(f"Captcha rejected (attempt {attempt} of {CAPTCHA_MAX_ATTEMPTS}).")
+    return False
+
+def submit_captcha(page, run):
+    """
+    Enter the operator's answer and submit the appointment. A rejected answer is
+    handed over again with the captcha then shown, up to CAPTCHA_MAX_ATTEMPTS times.
+    """
+    handoff = run['captcha']
+    for attempt in captcha_attempts(handoff):
+        if not handoff.waiting:
+            handoff.push(page, step_timeout('captcha_image'))
+        captcha_text = handoff.collect(page, step_timeout('captcha_answer'))
+        captcha_selector, _ = selector_registry.resolve(page, 'captcha_input')
+        if not captcha_selector:
+            handoff.report(None)
+            raise Exception("Captcha input not found.")
+        page.fill(captcha_selector, captcha_text)
+        page.evaluate(CAPTCHA_OUTCOME_JS, CAPTCHA_ERROR_SELECTOR)
+        page.click(CAPTCHA_NEXT_SELECTOR)
+        try:
+            page.wait_for_function(CAPTCHA_JUDGED_JS, arg='/appointment', timeout=step_timeout('captcha_result'))
+        except Exception:
+            handoff.report(None)
+            raise
+        if captcha_accepted(handoff, page.url, attempt):
             return
 
-        max_attempts = 2
-        success = False
+def step_appointment(page, run):
+    wait_for_url(page, portal_url('appointment'), step='appointment')
+
+    log.debug("Waiting for appointment form elements")
+    wait_until_ready(page, 'appointment', step='appointment')
+    # The operator reads the captcha while the calendar is being scanned
+    push_captcha(page, run)
+    wait_for_selector_state(page, '#mat-select-1', step='appointment')
+
+    # The applicant's office first, then the alternatives in the order given
+    for country, location in run['preferences'].locations:
+        if select_appointment_slot(page, run, country, location):
+            break
+        log.warning(f"No allowed slot at {location}, trying the next location.")
+        if page.is_visible(CALENDAR_SELECTOR):
+            page.keyboard.press('Escape')
+    else:
+        raise Exception("No appointment slot matching the applicant's preferences at any location.")
+
+    submit_captcha(page, run)
+
+# Index of the first form section whose first field is in the DOM, or -1
+CURRENT_SECTION_JS = 'selectors => selectors.findIndex(s => document.querySelector(s))'
+
+def section_first_selectors():
+    """Selector of the first field of each request-form section, in form order."""
+    return [FORM_SECTIONS[section][0][1] for section in FORM_SECTION_ORDER]
+
+def step_request_form(page, run):
+    wait_for_url(page, portal_url('request-form'), step='request_form')
+    wait_until_ready(page, 'request_form', step='request_form')
+
+    # On a resumed run earlier sections are already submitted; start at the one on screen
+    fillers = [fill_demographic_info, fill_citizenship_info, fill_applicant_contact, fill_emergency_contact]
+    shown = page.evaluate(CURRENT_SECTION_JS, section_first_selectors())
+    for section, fill in list(zip(FORM_SECTION_ORDER, fillers))[max(shown, 0):]:
+        fill(page, run['fill_plans'][section])
+
+def step_final_screenshot(page, run):
+    try:
+        page.screenshot(path=artifact_path(run, 'final_page.png'), timeout=step_timeout('screenshot'))
+    except Exception as e:
+        log.warning(f"Failed to take final screenshot: {e}")
+
+def on_portal_path(url, path):
+    """True if url is the portal page at path (query string ignored)."""
+    return url.split('?')[0].rstrip('/') == portal_url(path).rstrip('/')
+
+def entry_check(path=None, selector=None):
+    """
+    Build a cheap check that the page is where a state can start: on the given portal
+    path and/or with the selector currently visible. Nothing is waited for.
+    The path and selector are kept on the check so the async engine can reuse them.
+    """
+    def check(page):
+        if path is not None and not on_portal_path(page.url, path):
+            return False
+        return selector is None or page.is_visible(selector)
+    check.path = path
+    check.selector = selector
+    return check
+
+# The flow as explicit states, in order: (state id, step label, step function, entry check).
+# Each step takes (page, run) where run holds the applicant data and per-run helpers.
+# A state without an entry check can always start (it navigates on its own).
+STATES = [
+    ('home', "Step 1: Navigating to home page", step_home, None),
+    ('first_issuance', "Step 2: Clicking on First Issuance", step_first_issuance,
+     entry_check('', ':text-is("First Issuance")')),
+    ('passport_type', "Step 3: Selecting passport type", step_passport_type, entry_check('request-service')),
+    ('proceed', "Step 4: Clicking Proceed button", step_proceed,
+     entry_check('request-service', selector_registry.combined('proceed'))),
+    ('terms', "Step 5: Agreeing to terms", step_terms, entry_check(selector=AGREE_SELECTOR)),
+    ('appointment', "Step 6: Filling appointment details", step_appointment, entry_check('appointment')),
+    ('request_form', "Step 7: Filling request form", step_request_form, entry_check('request-form')),
+    ('final_screenshot', "Step 8: Taking final screenshot", step_final_screenshot,
+     entry_check('request-form', FORM_SUBMITTED_SELECTOR)),
+]
+STATE_IDS = [state for state, *_ in STATES]
+
+# Checks that a state's effect took, so a run that failed in it may go on with the next
+# state. Entry checks do not show this: the Proceed link is on /request-service before
+# the passport type is selected, and /request-form is shown before its last section is
+# submitted. A state missing here is run again after it fails.
+DONE_CHECKS = {
+    'home': entry_check('', ':text-is("First Issuance")'),
+    'first_issuance': entry_check('request-service'),
+    'passport_type': entry_check('request-service', PASSPORT_RADIO_CHECKED_SELECTOR),
+    'proceed': entry_check(selector=AGREE_SELECTOR),
+    'terms': entry_check('appointment'),
+    'appointment': entry_check('request-form'),
+    'request_form': entry_check('request-form', FORM_SUBMITTED_SELECTOR),
+}
+STEPS = [(label, step) for _, label, step, _ in STATES]
+
+# How often each state may be retried before the run gives up, and the backoff between tries
+STATE_RETRY_BUDGET = {'default': 2, 'home': 3, 'proceed': 3}
+# Answers tried per pass through the appointment state
+CAPTCHA_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_MS = int(os.environ.get('AUTOFORM_RETRY_BACKOFF_MS', '1000'))
+MAX_BACKOFF_MS = 8000
+
+def run_state(data, record_id=None, fill_plans=None, slot_capture=None):
+    """The per-run state the steps of both engines share. fill_plans comes from validation.prepare_record()."""
+    return {'data': data, 'record_id': record_id, 'slot_capture': slot_capture,
+            'captcha': new_handoff(solve_captcha, record_id),
+            'preferences': load_preferences(data), 'fill_plans': fill_plans or compile_fill_plans(data)}
+
+def new_run(page, data, record_id=None, fill_plans=None):
+    """Set up the per-run state shared by the steps."""
+    page.on("dialog", lambda dialog: dialog.accept())
+    # In network mode the slot data the calendar downloads is indexed as it arrives
+    slot_capture = SlotCapture(page) if SLOT_SOURCE == 'network' else None
+    return run_state(data, record_id, fill_plans, slot_capture)
 
-        for attempt in range(max_attempts):
+def artifact_path(run, filename):
+    """Where to write a screenshot; batch records each get their own directory."""
+    if not run.get('record_id'):
+        return filename
+    directory = os.path.join(BATCH_ARTIFACTS_DIR, str(run['record_id']))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+def resume_candidates(failed_index):
+    """
+    The states a run may continue from after a failure, as (index, check) in order of
+    preference: the next state if the failed one's DONE_CHECKS entry shows it finished,
+    then the failed state and the ones before it by their entry checks. The first whose
+    check passes, or that has none, wins.
+    """
+    candidates = []
+    done = DONE_CHECKS.get(STATES[failed_index][0])
+    if done and failed_index + 1 < len(STATES):
+        candidates.append((failed_index + 1, done))
+    candidates.extend((index, STATES[index][3]) for index in range(failed_index, -1, -1))
+    return candidates
+
+def resume_index(page, failed_index):
+    """Pick the state to continue from after a failure (see resume_candidates)."""
+    for index, check in resume_candidates(failed_index):
+        if check is None or check(page):
+            return index
+    return 0
+
+def write_checkpoint(run, status, index, completed, retries):
+    """Record progress through run['checkpoint'] (status.json by default)."""
+    state = STATES[index][0] if index < len(STATES) else None
+    details = {'state': state, 'completed': completed, 'retries': retries,
+               'updated': datetime.now().isoformat(timespec='seconds')}
+    try:
+        run.get('checkpoint', lambda status, **details: write_status(STATUS_FILE, status, **details))(status, **details)
+    except OSError as e:
+        log.warning(f"Could not write checkpoint: {e}")
+
+class RunProgress:
+    """
+    The retry bookkeeping of run_with_retries, shared by both engines: the current
+    state, the states completed, the retries per state, the backoff and the
+    checkpoints. The engines only run the steps and wait.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.index = 0
+        self.completed = []
+        self.retries = {}
+
+    @property
+    def finished(self):
+        return self.index >= len(STATES)
+
+    @property
+    def state(self):
+        """(state id, step label, step function, entry check) of the current state."""
+        return STATES[self.index]
+
+    @property
+    def span_kind(self):
+        return 'retry' if self.retries.get(self.state[0]) else 'step'
+
+    def checkpoint(self, status):
+        write_checkpoint(self.run, status, self.index, self.completed, self.retries)
+
+    def step_done(self):
+        if self.state[0] not in self.completed:
+            self.completed.append(self.state[0])
+        self.index += 1
+
+    def step_failed(self):
+        """
+        Count a failure of the current state. Returns the backoff in ms before the run
+        resumes, or None once the state's retry budget is exhausted and the run has failed.
+        """
+        state = self.state[0]
+        tries = self.retries.get(state, 0)
+        self.retries[state] = tries + 1
+        if self.retries[state] >= STATE_RETRY_BUDGET.get(state, STATE_RETRY_BUDGET['default']):
+            log.error(f"Retry budget for state '{state}' exhausted, stopping.")
+            # Nobody should keep typing an answer for a run that gave up
+            self.run['captcha'].withdraw()
+            self.checkpoint('Failed')
+            log.error("Failed to complete the process after all attempts.")
+            return None
+        backoff = min(RETRY_BACKOFF_MS * 2 ** tries, MAX_BACKOFF_MS)
+        log.warning(f"Retrying in {backoff} ms...")
+        return backoff
+
+    def resume_at(self, index):
+        self.index = index
+        # States from the resume point on have to run again
+        self.completed = [s for s in self.completed if STATE_IDS.index(s) < index]
+        log.info(f"Resuming from state '{STATES[index][0]}'.")
+
+    def succeeded(self):
+        self.checkpoint('Success')
+        log.info("Form submission completed successfully!")
+
+def run_with_retries(page, run):
+    """
+    Run the states in order, checkpointing after each. After an error the run resumes
+    from the last state the page can still enter instead of starting over, with a retry
+    budget per state and exponential backoff. Returns True on success.
+    """
+    progress = RunProgress(run)
+    while not progress.finished:
+        state, label, step, _ = progress.state
+        progress.checkpoint('Running')
+        try:
+            log.info(label)
+            with span(label, kind=progress.span_kind, state=state):
+                step(page, run)
+            progress.step_done()
+            continue
+
+        except Exception as e:
+            log.error(f"An error occurred in state '{state}': {e}")
             try:
-                print(f"Attempt {attempt + 1}: Step 1: Navigating to home page")
-                page.goto('https://emrtds.nepalpassport.gov.np/')
-                
-                login_required = page.query_selector('text="Log In"') or page.query_selector('text="Login"')
-                if login_required:
-                    print("Login required, please log in manually.")
-                    raise Exception("Login required, stopping for manual intervention.")
-                
-                print("Step 2: Clicking on First Issuance")
-                page.click('text="First Issuance"')
-                page.wait_for_url('https://emrtds.nepalpassport.gov.np/request-service', timeout=20000)
-                
-                print("Step 3: Selecting passport type")
-                page.wait_for_selector('label:has-text("Ordinary 34 pages")', timeout=15000)
-                radio_selector = 'input[type="radio"] + label:has-text("Ordinary 34 pages")'
-                is_selected = page.eval_on_selector(radio_selector, 'element => element.previousElementSibling.checked')
-                if not is_selected:
-                    page.click(radio_selector)
-                    print("Selected Ordinary 34 pages")
-                else:
-                    print("Ordinary 34 pages is already selected")
-                time.sleep(2)
-                
-                print("Step 4: Clicking Proceed button")
-                proceed_selector = 'a:has-text("Proceed")'
-                page.wait_for_selector(proceed_selector, state="visible", timeout=20000)
-                page.evaluate('element => element.scrollIntoView()', page.query_selector(proceed_selector))
-                
-                for click_attempt in range(3):
-                    try:
-                        page.click(proceed_selector)
-                        print(f"Successfully clicked Proceed on attempt {click_attempt + 1}")
-                        break
-                    except Exception as e:
-                        print(f"Click attempt {click_attempt + 1} failed: {e}, retrying...")
-                        time.sleep(2)
-                else:
-                    raise Exception("Failed to click Proceed button after 3 attempts")
-                
-                page.wait_for_load_state('networkidle', timeout=30000)
-                time.sleep(5)
-                
-                print("Taking screenshot after clicking Proceed")
-                page.screenshot(path='post_proceed.png')
-                
-                print("Page content after clicking Proceed:")
-                print(page.content())
-                
-                current_url = page.url
-                if current_url == 'https://emrtds.nepalpassport.gov.np/':
-                    print("Detected redirect to homepage, attempting to restart...")
-                    continue
-                
-                print("Step 5: Agreeing to terms")
-                agree_selector = 'a:has-text("I agree स्वीकृत छ")'
-                page.wait_for_selector(agree_selector, state="visible", timeout=15000)
-                page.click(agree_selector)
-                print("Clicked 'I agree' on the modal")
-                
-                print("Step 6: Filling appointment details")
-                page.wait_for_url('https://emrtds.nepalpassport.gov.np/appointment', timeout=30000)
-                
-                print("Waiting for appointment form elements")
-                page.wait_for_selector('#mat-select-0', state="visible", timeout=20000)
-                page.wait_for_selector('#mat-select-1', state="visible", timeout=20000)
-                
-                print("Selecting appointment country as Other")
-                page.click('#mat-select-0')
-                page.wait_for_selector('mat-option', state="visible", timeout=10000)
-                page.click('mat-option span:text("Other")')
-                
-                print("Selecting appointment location as NE, Tokyo")
-                page.click('#mat-select-1')
-                page.wait_for_selector('mat-option', state="visible", timeout=10000)
-                page.click('mat-option span:text("NE, Tokyo")')
-                
-                # Add a small delay to ensure dropdown selections are processed
-                time.sleep(2)
-                
-                # Trigger the date picker with multiple attempts
-                print("Attempting to trigger the date picker")
-                date_input_selectors = [
-                    'input[formcontrolname="appointmentDate"]',
-                    'mat-form-field input',
-                    'mat-datepicker-toggle',
-                    'input[type="date"]',
-                    '[placeholder*="Select Date"]',
-                    'label:has-text("Appointment Date")',
-                    'mat-label:has-text("Appointment Date") + input'
-                ]
-                date_input_triggered = False
-                for selector in date_input_selectors:
-                    try:
-                        date_input = page.query_selector(selector)
-                        if date_input and date_input.is_visible():
-                            date_input.click()
-                            print(f"Clicked date input using selector: {selector}")
-                            date_input_triggered = True
-                            break
-                    except Exception as e:
-                        print(f"Failed to click selector {selector}: {e}")
-                if not date_input_triggered:
-                    print("No specific date input found, trying generic click on form fields")
-                    try:
-                        page.click('form mat-form-field, form button, form input', timeout=10000)
-                    except Exception as e:
-                        print(f"Generic click failed: {e}")
-                
-                # Wait for the calendar to appear after triggering
-                print("Waiting for the calendar to appear")
-                page.wait_for_selector('table.ui-datepicker-calendar', state="visible", timeout=15000)
-                
-                print("Logging appointment form HTML for debugging:")
-                appointment_form = page.query_selector('form')
-                if appointment_form:
-                    print(appointment_form.inner_html())
-                else:
-                    print("Appointment form not found, logging entire page content:")
-                    print(page.content())
-
-                print("Pausing for 30 seconds to allow manual inspection...")
-                print("Inspect the calendar (e.g., right-click June 4 and select 'Inspect').")
-                time.sleep(30)
-
-                if not check_for_available_date(page):
-                    raise Exception("Failed to select an available date.")
-                
-                print("Selecting appointment time")
-                time_slot_selector = 'mat-chip:not(.mat-chip-disabled)'
-                page.wait_for_selector('mat-chip-list', state="visible", timeout=10000)
-                available_time_slots = page.locator(time_slot_selector).all()
-                if not available_time_slots:
-                    raise Exception("No available time slots found for the selected date.")
-                
-                available_times = ["11:30", "12:00"]
-                for time_value in available_times:
-                    try:
-                        time_slot = page.locator(f'mat-chip:not(.mat-chip-disabled):text-is("{time_value}")')
-                        if time_slot.is_visible():
-                            time_slot.click()
-                            print(f"Selected time: {time_value}")
-                            break
-                    except Exception:
-                        print(f"Time {time_value} not available, trying next...")
-                else:
-                    print("Neither 11:30 nor 12:00 available, proceeding with first available time slot.")
-                    available_time_slots[0].click()
-                    print(f"Selected first available time slot: {available_time_slots[0].inner_text()}")
-                
-                print("Solving captcha")
-                captcha_text = solve_captcha(page)
-                page.fill('input[name="text"]', captcha_text)  # Updated selector based on HTML
-                page.click('button:has-text("Next")')
-                
-                print("Step 7: Filling request form")
-                page.wait_for_url('https://emrtds.nepalpassport.gov.np/request-form', timeout=30000)
-                
-                fill_demographic_info(page, data)
-                fill_citizenship_info(page, data)
-                fill_applicant_contact(page, data)
-                fill_emergency_contact(page, data)
-                
-                print("Step 8: Taking final screenshot")
-                try:
-                    page.screenshot(path='final_page.png', timeout=10000)
-                except Exception as e:
-                    print(f"Failed to take final screenshot: {e}")
-                
-                print("Form submission completed successfully!")
-                success = True
-                break
-                
-            except Exception as e:
-                print(f"An error occurred during the process: {e}")
-                try:
-                    page.screenshot(path='error_page.png', timeout=10000)
-                except Exception as e_shot:
-                    print(f"Failed to take error screenshot: {e_shot}")
-                print("Page content on error:")
-                print(page.content())
-                
-                if attempt < max_attempts - 1:
-                    print("Retrying due to error...")
-                    time.sleep(2)
-                    continue
-                else:
-                    print("Max attempts reached, stopping.")
-                    break
-        
-        if not success:
-            print("Failed to complete the process after all attempts.")
-        browser.close()
-
-def fill_demographic_info(page, data):
+                page.screenshot(path=artifact_path(run, 'error_page.png'), timeout=step_timeout('screenshot'))
+            except Exception as e_shot:
+                log.warning(f"Failed to take error screenshot: {e_shot}")
+            dom_snapshot(page, f"Page on error in state '{state}'", level=logging.WARNING)
+
+        backoff = progress.step_failed()
+        if backoff is None:
+            return False
+        page.wait_for_timeout(backoff)
+        progress.resume_at(resume_index(page, progress.index))
+
+    progress.succeeded()
+    return True
+
+def write_status(path, status, **details):
+    """Write a run status file such as status.json ({"status": "Success"})."""
+    with open(path, 'w') as f:
+        json.dump(dict(status=status, **details), f)
+
+def main():
+    """
+    Automates the process of filling out a passport pre-enrollment form.
+    """
+    try:
+        with open('data.json', 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        log.error("Error: data.json not found. Please create a data.json file with your form data.")
+        return
+    # A bad record is reported now rather than after the calendar scan and the captcha
+    try:
+        fill_plans = prepare_record(data)
+    except InvalidRecord as e:
+        for error in e.errors:
+            log.error(f"data.json: {error}")
+        write_status(STATUS_FILE, 'Invalid', errors=e.errors)
+        return
+
+    tracer = Tracer(TRACE_FILE)
+    set_tracer(tracer)
+    with sync_playwright() as p:
+        session = BrowserSession(p, headless=HEADLESS)
+        context = session.open()
+        router = install_routing(context, portal_url())
+        if session.validate(portal_url(), PAGE_READY_SELECTORS['home'], step_timeout('navigation')):
+            log.info("Reusing stored session.")
+        if PLAYWRIGHT_TRACE:
+            context.tracing.start(screenshots=True, snapshots=True)
+        page = tracer.wrap_page(session.new_page())
+
+        run = new_run(page, data, fill_plans=fill_plans)
+        run_with_retries(page, run)
+
+        if PLAYWRIGHT_TRACE:
+            context.tracing.stop(path=PLAYWRIGHT_TRACE)
+            log.info(f"Playwright trace written to {PLAYWRIGHT_TRACE}")
+        if router:
+            router.print_stats()
+        session.save_state()
+        session.close()
+    tracer.print_summary()
+
+@traced('fill')
+def fill_demographic_info(page, plan):
     """Fills the demographic information section."""
-    print("Filling Demographic Information")
-    page.fill('#last_name', data['last_name'])
-    page.fill('#first_name', data['first_name'])
-    if data['gender'].lower() == 'male':
-        page.check('#gender_male')
-    elif data['gender'].lower() == 'female':
-        page.check('#gender_female')
-    else:
-        page.check('#gender_other')
-    page.fill('#dob_ad', data['dob_ad'])
-    page.fill('#dob_bs', data['dob_bs'])
-    page.select_option('#place_of_birth_district', label=data['place_of_birth_district'])
-    page.select_option('#birth_country', label=data['birth_country'])
-    page.select_option('#nationality', label=data['nationality'])
-    page.fill('#father_last_name', data['father_last_name'])
-    page.fill('#father_first_name', data['father_first_name'])
-    page.fill('#mother_last_name', data['mother_last_name'])
-    page.fill('#mother_first_name', data['mother_first_name'])
-    page.click('text="Next"')
-
-def fill_citizenship_info(page, data):
+    log.info("Filling Demographic Information")
+    fill_plan(page, plan)
+    page.click(FORM_NEXT_SELECTOR)
+
+@traced('fill')
+def fill_citizenship_info(page, plan):
     """Fills the citizenship information section."""
-    print("Filling Citizenship Information")
-    page.fill('#nin', data['nin'])
-    page.fill('#citizenship_number', data['citizenship_number'])
-    page.fill('#citizenship_issue_date_bs', data['citizenship_issue_date_bs'])
-    page.select_option('#citizenship_issue_district', label=data['citizenship_issue_district'])
-    page.click('text="Next"')
-
-def fill_applicant_contact(page, data):
+    log.info("Filling Citizenship Information")
+    fill_plan(page, plan)
+    page.click(FORM_NEXT_SELECTOR)
+
+@traced('fill')
+def fill_applicant_contact(page, plan):
     """Fills the applicant's contact details."""
-    print("Filling Applicant Contact Details")
-    page.fill('#mobile_number', data['mobile_number'])
-    page.fill('#email', data['email'])
-    page.fill('#main_address_house_number', data['main_address_house_number'])
-    page.fill('#main_address_street', data['main_address_street'])
-    page.fill('#main_address_ward', data['main_address_ward'])
-    page.select_option('#main_address_country', label=data['main_address_country'])
-    page.select_option('#main_address_province', label=data['main_address_province'])
-    page.select_option('#main_address_district', label=data['main_address_district'])
-    page.select_option('#main_address_municipality', label=data['main_address_municipality'])
-    page.click('text="Next"')
-
-def fill_emergency_contact(page, data):
+    log.info("Filling Applicant Contact Details")
+    fill_plan(page, plan)
+    page.click(FORM_NEXT_SELECTOR)
+
+@traced('fill')
+def fill_emergency_contact(page, plan):
     """Fills the emergency contact details."""
-    print("Filling Emergency Contact Details")
-    page.fill('#emergency_last_name', data['emergency_contact_last_name'])
-    page.fill('#emergency_first_name', data['emergency_contact_first_name'])
-    page.fill('#emergency_house_number', data['emergency_contact_house_number'])
-    page.fill('#emergency_street', data['emergency_contact_street'])
-    page.fill('#emergency_ward', data['emergency_contact_ward'])
-    page.select_option('#emergency_province', label=data['emergency_contact_province'])
-    page.select_option('#emergency_district', label=data['emergency_contact_district'])
-    page.select_option('#emergency_municipality', label=data['emergency_contact_municipality'])
-    page.select_option('#emergency_country', label=data['emergency_contact_country'])
-    page.fill('#emergency_phone', data['emergency_contact_phone'])
-    page.fill('#emergency_email', data['emergency_contact_email'])
-    page.click('text="Next"')
+    log.info("Filling Emergency Contact Details")
+    fill_plan(page, plan)
+    page.click(FORM_NEXT_SELECTOR)
 
 if __name__ == '__main__':
     main()
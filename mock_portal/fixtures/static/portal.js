@@ -0,0 +1,310 @@
+// Client side of the mock passport portal. It reproduces the parts of the real
+// Angular app the bot touches: the terms modal, the mat-select dropdowns, the
+// PrimeNG date picker, the mat-chip time slots and the multi-section request form.
+(function () {
+  'use strict';
+
+  var MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+                'August', 'September', 'October', 'November', 'December'];
+
+  function $(selector, root) { return (root || document).querySelector(selector); }
+
+  function getJSON(url) {
+    return fetch(url, {headers: {'Accept': 'application/json'}}).then(function (r) { return r.json(); });
+  }
+
+  function showError(id, message) {
+    var el = document.getElementById(id);
+    el.textContent = message;
+    el.hidden = !message;
+  }
+
+  // ---- request-service -------------------------------------------------------
+
+  function initRequestService() {
+    $('#proceed').addEventListener('click', function () {
+      if (!$('input[name="passportType"]:checked')) {
+        $('#type-error').hidden = false;
+        return;
+      }
+      getJSON('/api/terms').then(function () { $('#terms-modal').hidden = false; });
+    });
+  }
+
+  // ---- appointment -----------------------------------------------------------
+
+  function initAppointment() {
+    var state = {country: null, location: null, view: null, payload: null, date: null, time: null};
+    var overlay = $('#overlay');
+    var picker = $('#datepicker');
+    var dateInput = $('input[formcontrolname="appointmentDate"]');
+
+    function openSelect(select, options, onPick) {
+      overlay.innerHTML = '';
+      var panel = document.createElement('div');
+      panel.className = 'mat-select-panel';
+      options.forEach(function (label) {
+        var option = document.createElement('mat-option');
+        option.innerHTML = '<span class="mat-option-text"></span>';
+        option.firstChild.textContent = label;
+        option.addEventListener('click', function () {
+          select.querySelector('.mat-select-value').textContent = label;
+          overlay.innerHTML = '';
+          onPick(label);
+        });
+        panel.appendChild(option);
+      });
+      overlay.appendChild(panel);
+    }
+
+    $('#mat-select-0').addEventListener('click', function () {
+      getJSON('/api/countries').then(function (countries) {
+        openSelect($('#mat-select-0'), countries, function (label) {
+          state.country = label;
+          state.location = null;
+          $('#mat-select-1 .mat-select-value').textContent = 'Select Location';
+        });
+      });
+    });
+
+    $('#mat-select-1').addEventListener('click', function () {
+      getJSON('/api/locations?country=' + encodeURIComponent(state.country || '')).then(function (locations) {
+        openSelect($('#mat-select-1'), locations, function (label) { state.location = label; });
+      });
+    });
+
+    function monthKey(view) {
+      return view.year + '-' + String(view.month + 1).padStart(2, '0');
+    }
+
+    function loadMonth() {
+      var url = '/api/appointment/slots?location=' + encodeURIComponent(state.location || '') +
+                '&month=' + monthKey(state.view);
+      return getJSON(url).then(function (payload) {
+        state.payload = payload;
+        renderCalendar();
+      });
+    }
+
+    function renderCalendar() {
+      var byDate = {};
+      state.payload.dates.forEach(function (entry) { byDate[entry.date] = entry; });
+      var first = new Date(state.view.year, state.view.month, 1);
+      var daysInMonth = new Date(state.view.year, state.view.month + 1, 0).getDate();
+      var cells = [];
+      for (var i = 0; i < first.getDay(); i++) {
+        cells.push('<td class="ui-datepicker-other-month"></td>');
+      }
+      var anyAvailable = false;
+      for (var day = 1; day <= daysInMonth; day++) {
+        var iso = monthKey(state.view) + '-' + String(day).padStart(2, '0');
+        var entry = byDate[iso];
+        if (entry && entry.available) {
+          anyAvailable = true;
+          cells.push('<td><a class="ui-state-default" draggable="false" data-date="' + iso + '">' + day + '</a></td>');
+        } else {
+          cells.push('<td class="ui-datepicker-unselectable"><span class="ui-state-default ui-state-disabled">' + day + '</span></td>');
+        }
+      }
+      var rows = [];
+      for (var r = 0; r < cells.length; r += 7) {
+        rows.push('<tr>' + cells.slice(r, r + 7).join('') + '</tr>');
+      }
+      picker.innerHTML =
+        '<div class="ui-datepicker-header">' +
+          '<a class="ui-datepicker-prev"><span class="ui-datepicker-prev-icon pi pi-chevron-left"></span></a>' +
+          '<div class="ui-datepicker-title"><span class="ui-datepicker-month">' + MONTHS[state.view.month] +
+          '</span> <span class="ui-datepicker-year">' + state.view.year + '</span></div>' +
+          '<a class="ui-datepicker-next"><span class="ui-datepicker-next-icon pi pi-chevron-right"></span></a>' +
+        '</div>' +
+        '<table class="ui-datepicker-calendar"><thead><tr><th>Su</th><th>Mo</th><th>Tu</th><th>We</th>' +
+        '<th>Th</th><th>Fr</th><th>Sa</th></tr></thead><tbody>' + rows.join('') + '</tbody></table>' +
+        (anyAvailable ? '' : '<p class="no-slots">There are no available slots at the moment</p>');
+    }
+
+    function renderTimeSlots(entry) {
+      var chips = entry.slots.map(function (slot) {
+        var cls = 'mat-chip' + (slot.available ? '' : ' mat-chip-disabled');
+        return '<mat-chip class="' + cls + '" data-time="' + slot.time + '">' + slot.time + '</mat-chip>';
+      });
+      $('#time-slots').innerHTML = '<mat-chip-list>' + chips.join('') + '</mat-chip-list>';
+    }
+
+    dateInput.addEventListener('click', function () {
+      if (!state.view) {
+        var today = new Date();
+        state.view = {year: today.getFullYear(), month: today.getMonth()};
+      }
+      picker.hidden = false;
+      loadMonth();
+    });
+
+    picker.addEventListener('click', function (event) {
+      var target = event.target;
+      if (target.closest('.ui-datepicker-next') || target.closest('.ui-datepicker-prev')) {
+        var step = target.closest('.ui-datepicker-next') ? 1 : -1;
+        var month = state.view.month + step;
+        state.view = {year: state.view.year + Math.floor(month / 12), month: (month + 12) % 12};
+        loadMonth();
+        return;
+      }
+      var link = target.closest('a[data-date]');
+      if (!link) return;
+      var entry = state.payload.dates.filter(function (d) { return d.date === link.dataset.date; })[0];
+      state.date = entry.date;
+      state.time = null;
+      dateInput.value = entry.date;
+      picker.hidden = true;
+      renderTimeSlots(entry);
+    });
+
+    $('#time-slots').addEventListener('click', function (event) {
+      var chip = event.target.closest('mat-chip');
+      if (!chip || chip.classList.contains('mat-chip-disabled')) return;
+      Array.prototype.forEach.call(document.querySelectorAll('mat-chip'), function (c) {
+        c.classList.remove('mat-chip-selected');
+      });
+      chip.classList.add('mat-chip-selected');
+      state.time = chip.dataset.time;
+    });
+
+    $('#appointment-next').addEventListener('click', function () {
+      var captcha = $('input[name="text"]').value.trim();
+      if (!state.location || !state.date || !state.time) {
+        showError('appointment-error', 'Please select a location, date and time.');
+        return;
+      }
+      if (!captcha) {
+        showError('appointment-error', 'Please enter the captcha.');
+        return;
+      }
+      fetch('/api/appointment', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({location: state.location, date: state.date, time: state.time, captcha: captcha})
+      }).then(function (r) {
+        if (r.ok) {
+          window.location.href = '/request-form';
+        } else {
+          showError('appointment-error', 'Invalid captcha, please try again.');
+        }
+      });
+    });
+  }
+
+  // ---- request-form ----------------------------------------------------------
+
+  function initRequestForm() {
+    var model = {};
+    var index = 0;
+    var container = $('#form-section');
+
+    getJSON('/api/form-sections').then(function (config) {
+      var sections = config.sections;
+
+      function optionsFor(field) {
+        if (!field.depends_on) return config.options[field.options];
+        var parent = model[field.depends_on];
+        return (config.options[field.options] || {})[parent] || [];
+      }
+
+      function fillSelect(select, field) {
+        var options = optionsFor(field);
+        select.innerHTML = '<option value="">-- Select --</option>' + options.map(function (label, i) {
+          return '<option value="' + (i + 1) + '">' + label + '</option>';
+        }).join('');
+      }
+
+      function bind(input, field) {
+        var update = function () {
+          if (field.type === 'radio') {
+            if (input.checked) model[field.name] = input.value;
+          } else if (field.type === 'select') {
+            model[field.name] = input.value ? input.options[input.selectedIndex].text : '';
+          } else {
+            model[field.name] = input.value;
+          }
+          // Dependent dropdowns are repopulated as soon as their parent changes
+          sections[index].fields.forEach(function (child) {
+            if (child.depends_on === field.name) {
+              delete model[child.name];
+              fillSelect(document.getElementById(child.id), child);
+            }
+          });
+        };
+        input.addEventListener('input', update);
+        input.addEventListener('change', update);
+      }
+
+      function render() {
+        var section = sections[index];
+        container.innerHTML = '<h2>' + section.title + '</h2>';
+        section.fields.forEach(function (field) {
+          var row = document.createElement('div');
+          row.className = 'field';
+          if (field.type === 'radio') {
+            row.innerHTML = '<span class="label">' + field.label + '</span>';
+            field.choices.forEach(function (choice) {
+              var input = document.createElement('input');
+              input.type = 'radio';
+              input.name = field.name;
+              input.id = choice.id;
+              input.value = choice.value;
+              var label = document.createElement('label');
+              label.htmlFor = choice.id;
+              label.textContent = choice.value;
+              row.appendChild(input);
+              row.appendChild(label);
+              bind(input, field);
+            });
+          } else {
+            row.innerHTML = '<label for="' + field.id + '">' + field.label + '</label>';
+            var control = document.createElement(field.type === 'select' ? 'select' : 'input');
+            control.id = field.id;
+            if (field.type === 'select') {
+              fillSelect(control, field);
+            } else {
+              control.type = 'text';
+            }
+            row.appendChild(control);
+            bind(control, field);
+          }
+          container.appendChild(row);
+        });
+        var next = document.createElement('button');
+        next.type = 'button';
+        next.textContent = 'Next';
+        next.addEventListener('click', advance);
+        container.appendChild(next);
+      }
+
+      function advance() {
+        var missing = sections[index].fields.filter(function (field) { return !model[field.name]; });
+        if (missing.length) {
+          showError('form-error', 'Required: ' + missing.map(function (f) { return f.label; }).join(', '));
+          return;
+        }
+        showError('form-error', '');
+        index += 1;
+        if (index < sections.length) {
+          render();
+          return;
+        }
+        fetch('/api/request-form', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify(model)
+        }).then(function () {
+          container.innerHTML = '<h2 id="review">Review your application</h2>';
+        });
+      }
+
+      render();
+    });
+  }
+
+  var page = document.body.dataset.page;
+  if (page === 'request-service') initRequestService();
+  if (page === 'appointment') initAppointment();
+  if (page === 'request-form') initRequestForm();
+})();
@@ -0,0 +1,204 @@
+"""
+Local stand-in for the passport portal, used to run and benchmark the bot offline.
+
+    python -m mock_portal.server --port 8765 --slot-density 0.3 --month-depth 2
+
+then run the bot with PASSPORT_BASE_URL=http://127.0.0.1:8765/.
+"""
+import argparse
+import calendar
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+PAGES = {
+    '/': 'index.html',
+    '/request-service': 'request-service.html',
+    '/appointment': 'appointment.html',
+    '/request-form': 'request-form.html',
+}
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.json': 'application/json',
+    '.png': 'image/png',
+}
+LOCATIONS = {
+    'Nepal': ['DoP, Kathmandu', 'DAO, Lalitpur', 'DAO, Kaski'],
+    'Other': ['NE, Tokyo', 'NE, Seoul', 'NE, Doha', 'NE, Kuala Lumpur'],
+}
+
+DEFAULT_CONFIG = {
+    # Share of open days (from today on) that have slots
+    'slot_density': 0.3,
+    # Number of months, counting the current one, with no slots at all
+    'month_depth': 0,
+    # Time slots listed per available day, every 30 minutes from 09:00
+    'times_per_day': 6,
+    # Artificial server latency for API calls, in milliseconds
+    'latency_ms': 0,
+    # Accepted captcha text; None accepts any non-empty answer
+    'captcha_answer': None,
+    'seed': 1,
+}
+
+def make_png(width, height, shade):
+    """A plain grey PNG, used for the logo and the captcha image."""
+    row = b'\x00' + bytes([shade]) * width
+    raw = zlib.compress(row * height)
+
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', raw) + chunk(b'IEND', b'')
+
+def month_slots(config, location, year, month):
+    """Deterministic slot data for one location and month, in the shape the calendar fetches."""
+    today = date.today()
+    offset = (year - today.year) * 12 + month - today.month
+    dates = []
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        current = date(year, month, day)
+        rng = random.Random(f"{config['seed']}:{location}:{current.isoformat()}")
+        # Saturdays are closed
+        available = (offset >= config['month_depth'] and current >= today and current.weekday() != 5
+                     and rng.random() < config['slot_density'])
+        slots = []
+        if available:
+            for i in range(config['times_per_day']):
+                minutes = 9 * 60 + 30 * i
+                slots.append({'time': f"{minutes // 60:02d}:{minutes % 60:02d}", 'available': rng.random() < 0.7})
+            if slots and not any(slot['available'] for slot in slots):
+                slots[rng.randrange(len(slots))]['available'] = True
+        dates.append({'date': current.isoformat(), 'available': available and bool(slots), 'slots': slots})
+    return {'location': location, 'month': f"{year}-{month:02d}", 'dates': dates}
+
+class PortalHandler(BaseHTTPRequestHandler):
+    server_version = 'MockPortal/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if content_type.startswith(('application/javascript', 'text/css', 'image/')):
+            self.send_header('Cache-Control', 'public, max-age=3600')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(json.dumps(payload).encode('utf-8'), 'application/json', status)
+
+    def send_fixture(self, name):
+        path = os.path.join(FIXTURES_DIR, name)
+        if not os.path.isfile(path):
+            self.send_body(b'Not found', 'text/plain', 404)
+            return
+        with open(path, 'rb') as f:
+            self.send_body(f.read(), CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'))
+
+    def api_delay(self):
+        if self.server.config['latency_ms']:
+            time.sleep(self.server.config['latency_ms'] / 1000)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        config = self.server.config
+
+        if url.path in PAGES:
+            self.send_fixture(PAGES[url.path])
+        elif url.path.startswith('/static/') and url.path.endswith('.png'):
+            self.send_body(make_png(40, 40, 200), 'image/png')
+        elif url.path.startswith('/static/'):
+            self.send_fixture(url.path.lstrip('/').replace('/', os.sep))
+        elif url.path == '/captcha.png':
+            self.send_body(make_png(120, 40, 90), 'image/png')
+        elif url.path.startswith('/api/'):
+            self.api_delay()
+            if url.path == '/api/terms':
+                self.send_json({'accepted': False})
+            elif url.path == '/api/countries':
+                self.send_json(list(LOCATIONS))
+            elif url.path == '/api/locations':
+                self.send_json(LOCATIONS.get(query.get('country'), []))
+            elif url.path == '/api/form-sections':
+                self.send_fixture('form_sections.json')
+            elif url.path == '/api/appointment/slots':
+                year, month = (int(part) for part in query.get('month', date.today().strftime('%Y-%m')).split('-'))
+                self.send_json(month_slots(config, query.get('location', ''), year, month))
+            else:
+                self.send_json({'error': 'not found'}, 404)
+        else:
+            self.send_body(b'Not found', 'text/plain', 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json({'error': 'invalid json'}, 400)
+            return
+        self.api_delay()
+
+        if url.path == '/api/appointment':
+            expected = self.server.config['captcha_answer']
+            if not payload.get('captcha') or (expected is not None and payload['captcha'] != expected):
+                self.send_json({'error': 'invalid captcha'}, 400)
+                return
+            self.server.submissions.append({'appointment': payload})
+            self.send_json({'ok': True})
+        elif url.path == '/api/request-form':
+            self.server.submissions.append({'request_form': payload})
+            self.send_json({'ok': True})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+def start_server(port=0, verbose=False, **config):
+    """
+    Start the mock portal on a background thread.
+    Returns (server, base_url); stop it with server.shutdown().
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), PortalHandler)
+    server.config = dict(DEFAULT_CONFIG, **config)
+    server.submissions = []
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the mock passport portal.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--slot-density', type=float, default=DEFAULT_CONFIG['slot_density'])
+    parser.add_argument('--month-depth', type=int, default=DEFAULT_CONFIG['month_depth'])
+    parser.add_argument('--times-per-day', type=int, default=DEFAULT_CONFIG['times_per_day'])
+    parser.add_argument('--latency-ms', type=int, default=DEFAULT_CONFIG['latency_ms'])
+    parser.add_argument('--captcha-answer', default=None)
+    args = parser.parse_args()
+
+    server, base_url = start_server(
+        port=args.port, verbose=True, slot_density=args.slot_density, month_depth=args.month_depth,
+        times_per_day=args.times_per_day, latency_ms=args.latency_ms, captcha_answer=args.captcha_answer)
+    print(f"Mock portal running at {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+
+from logs import get_logger
+
+log = get_logger('option_cache')
+
+SELECT_OPTIONS_FILE = os.environ.get('AUTOFORM_SELECT_OPTIONS_CACHE', os.path.join('.cache', 'select_options.json'))
+
+# Option labels of the given <select> elements, keyed by selector; missing selects are left out
+SELECT_OPTIONS_JS = """
+selectors => {
+    const found = {};
+    for (const selector of selectors) {
+        const el = document.querySelector(selector);
+        if (!el || !el.options) continue;
+        found[selector] = Array.from(el.options)
+            .filter(o => o.value !== '')
+            .map(o => o.text.trim());
+    }
+    return found;
+}
+"""
+
+def context_key(context):
+    """Stable key for the values of the selects filled before a select, e.g. 'Nepal|Bagmati'."""
+    return '|'.join(context)
+
+class SelectOptionCache:
+    """
+    Option labels seen for each <select> of the request form, recorded while filling so
+    records can be checked before a browser is started. Dependent dropdowns (district
+    after province, ...) offer different lists, so each list is kept under the values of
+    the selects filled before it in the same section.
+    """
+
+    def __init__(self, path=SELECT_OPTIONS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.cache = {}
+
+    def record(self, plan, labels_by_selector):
+        """Store the option lists read for the select fields of a filled plan."""
+        changed = False
+        with self.lock:
+            context = []
+            for field in plan:
+                if field['kind'] != 'select':
+                    continue
+                labels = labels_by_selector.get(field['selector'])
+                if labels:
+                    entries = self.cache.setdefault(field['selector'], {})
+                    key = context_key(context)
+                    if entries.get(key) != labels:
+                        entries[key] = labels
+                        changed = True
+                context.append(field['value'])
+            if changed:
+                self.save()
+
+    def labels_for(self, selector, context):
+        """
+        Known labels of the select given the values filled before it, or None when
+        unknown. A select whose list never changed with the context is treated as
+        independent of it.
+        """
+        entries = self.cache.get(selector)
+        if not entries:
+            return None
+        key = context_key(context)
+        if key in entries:
+            return entries[key]
+        lists = list(entries.values())
+        if len(entries) > 1 and all(labels == lists[0] for labels in lists):
+            return lists[0]
+        return None
+
+    def save(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.cache, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning(f"Could not save select option cache: {e}")
+
+select_option_cache = SelectOptionCache()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from logs import get_logger
+
+log = get_logger('routing')
+
+# 'lean' blocks what the bot never needs and serves static bundles from disk; 'full' loads everything
+PROFILE = os.environ.get('AUTOFORM_PROFILE', 'lean')
+STATIC_CACHE_DIR = os.environ.get('AUTOFORM_STATIC_CACHE_DIR', os.path.join('.cache', 'static'))
+# Bundles without a content hash in their name are refetched after this many seconds
+STATIC_CACHE_TTL = int(os.environ.get('AUTOFORM_STATIC_CACHE_TTL', str(24 * 3600)))
+
+PROFILES = {
+    'full': None,
+    'lean': {
+        'block_types': {'image', 'media', 'font', 'texttrack', 'manifest'},
+        # The captcha is an image the operator has to read
+        'allow_pattern': re.compile(r'captcha', re.I),
+        # Other sites may still serve pages, API calls and scripts; only these are blocked from them
+        'third_party_block_types': {'stylesheet', 'other'},
+        # Hosts treated as first-party besides the portal's own site (comma separated in AUTOFORM_ALLOW_HOSTS)
+        'allow_hosts': {h.strip() for h in os.environ.get('AUTOFORM_ALLOW_HOSTS', '').split(',') if h.strip()},
+        'cache_types': {'script', 'stylesheet'},
+    },
+}
+
+def portal_site(host):
+    """
+    The domain whose subdomains (an API or SSO host next to the portal) count as
+    first-party: the portal host without its first label, as long as three labels
+    remain (emrtds.nepalpassport.gov.np -> nepalpassport.gov.np). Shorter hosts and
+    IP addresses stand for themselves, since their parent may be a public suffix.
+    """
+    labels = (host or '').split('.')
+    if len(labels) > 3 and not all(label.isdigit() for label in labels):
+        return '.'.join(labels[1:])
+    return host
+
+# Angular build output such as main.3f1c2a9b8e7d6c5b.js never changes under the same name
+HASHED_BUNDLE_RE = re.compile(r'[.-][0-9a-f]{8,}\.(js|css)$')
+
+class RequestRouter:
+    """
+    context.route handler for the automation browser: aborts the resource types the
+    flow does not need (from other sites, also their stylesheets and beacons) and
+    caches first-party scripts and stylesheets on disk between runs.
+    """
+
+    def __init__(self, profile, base_url, cache_dir=STATIC_CACHE_DIR):
+        self.profile = profile
+        self.host = urlparse(base_url).hostname
+        self.site = portal_site(self.host)
+        self.cache_dir = cache_dir
+        self.stats = {'blocked': 0, 'cache_hits': 0, 'cache_misses': 0, 'bytes_from_cache': 0}
+
+    def first_party(self, host):
+        if host in self.profile['allow_hosts'] or host == self.site:
+            return True
+        return host is not None and host.endswith('.' + self.site)
+
+    def decide(self, request):
+        """'block', 'cache' or 'continue' for the request under this profile."""
+        url = request.url
+        if self.profile['allow_pattern'].search(url):
+            return 'continue'
+        if request.resource_type in self.profile['block_types']:
+            return 'block'
+        if not self.first_party(urlparse(url).hostname):
+            return 'block' if request.resource_type in self.profile['third_party_block_types'] else 'continue'
+        if request.method == 'GET' and request.resource_type in self.profile['cache_types']:
+            return 'cache'
+        return 'continue'
+
+    def route_action(self, request):
+        """decide(), counting the blocked requests for print_stats()."""
+        action = self.decide(request)
+        if action == 'block':
+            self.stats['blocked'] += 1
+        return action
+
+    def handle(self, route):
+        action = self.route_action(route.request)
+        if action == 'block':
+            route.abort('blockedbyclient')
+        elif action == 'cache':
+            self.serve_cached(route, route.request.url)
+        else:
+            route.continue_()
+
+    def cache_paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.cache_dir, key + '.body'), os.path.join(self.cache_dir, key + '.json')
+
+    def read_cache(self, url):
+        """Return (body, content type) of a fresh cached copy of url, or None (counted as a miss)."""
+        body_path, meta_path = self.cache_paths(url)
+        body = None
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if HASHED_BUNDLE_RE.search(urlparse(url).path) or time.time() - meta['stored'] < STATIC_CACHE_TTL:
+                with open(body_path, 'rb') as f:
+                    body = f.read()
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        if body is None:
+            self.stats['cache_misses'] += 1
+            return None
+        self.stats['cache_hits'] += 1
+        self.stats['bytes_from_cache'] += len(body)
+        return body, meta['content_type']
+
+    def write_file(self, path, data):
+        # Other contexts may read or rewrite the same entry at any time; they only ever see whole files
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+
+    def write_cache(self, url, response, body):
+        if response.status != 200:
+            return
+        body_path, meta_path = self.cache_paths(url)
+        meta = {'url': url, 'stored': time.time(),
+                'content_type': response.headers.get('content-type', 'application/octet-stream')}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.write_file(body_path, body)
+            self.write_file(meta_path, json.dumps(meta).encode('utf-8'))
+        except OSError as e:
+            log.warning(f"Could not cache {url}: {e}")
+
+    def serve_cached(self, route, url):
+        cached = self.read_cache(url)
+        if cached:
+            body, content_type = cached
+            route.fulfill(status=200, headers={'content-type': content_type}, body=body)
+            return
+
+        try:
+            response = route.fetch()
+            body = response.body()
+        except Exception as e:
+            self.fetch_failed(url, e)
+            route.continue_()
+            return
+        self.write_cache(url, response, body)
+        route.fulfill(response=response, body=body)
+
+    def fetch_failed(self, url, error):
+        log.warning(f"Could not fetch {url} for the cache ({error}), letting the browser load it.")
+
+    def print_stats(self):
+        log.info(f"Request routing: {self.stats['blocked']} blocked, {self.stats['cache_hits']} served from cache "
+                 f"({self.stats['bytes_from_cache'] // 1024} KiB), {self.stats['cache_misses']} cache misses.")
+
+def install_routing(context, base_url, profile_name=PROFILE):
+    """Route every request of the context through the named profile. Returns the router, or None for 'full'."""
+    profile = PROFILES.get(profile_name)
+    if profile is None:
+        return None
+    router = RequestRouter(profile, base_url)
+    context.route('**/*', router.handle)
+    return router
+
+class AsyncRequestRouter(RequestRouter):
+    """RequestRouter for contexts of the async API."""
+
+    async def handle(self, route):
+        action = self.route_action(route.request)
+        if action == 'block':
+            await route.abort('blockedbyclient')
+        elif action == 'cache':
+            await self.serve_cached(route, route.request.url)
+        else:
+            await route.continue_()
+
+    async def serve_cached(self, route, url):
+        cached = self.read_cache(url)
+        if cached:
+            body, content_type = cached
+            await route.fulfill(status=200, headers={'content-type': content_type}, body=body)
+            return
+
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception as e:
+            self.fetch_failed(url, e)
+            await route.continue_()
+            return
+        self.write_cache(url, response, body)
+        await route.fulfill(response=response, body=body)
+
+async def install_routing_async(context, base_url, profile_name=PROFILE):
+    """install_routing() for an async API context."""
+    profile = PROFILES.get(profile_name)
+    if profile is None:
+        return None
+    router = AsyncRequestRouter(profile, base_url)
+    await context.route('**/*', router.handle)
+    return router
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+from logs import get_logger
+
+log = get_logger('selector_cache')
+
+SELECTOR_CACHE_FILE = os.environ.get('AUTOFORM_SELECTOR_CACHE', os.path.join('.cache', 'selectors.json'))
+
+# Candidate selectors for each logical element, most specific first. This is the one
+# place to update when the portal's markup changes.
+SELECTOR_CANDIDATES = {
+    'proceed': [
+        'a:has-text("Proceed")',
+        'button:has-text("Proceed")',
+    ],
+    'date_input': [
+        'input[formcontrolname="appointmentDate"]',
+        'mat-form-field input',
+        'mat-datepicker-toggle',
+        'input[type="date"]',
+        '[placeholder*="Select Date"]',
+        'label:has-text("Appointment Date")',
+        'mat-label:has-text("Appointment Date") + input',
+    ],
+    'captcha_input': [
+        'input[name="text"]',
+        'input[formcontrolname="captcha"]',
+        'input[placeholder*="captcha" i]',
+    ],
+    'captcha_image': [
+        'img[src*="captcha" i]',
+        'img[alt*="captcha" i]',
+        'canvas[id*="captcha" i]',
+    ],
+}
+
+# Summarises the page's form structure; a changed portal build gives a different fingerprint
+FINGERPRINT_JS = """
+() => Array.from(document.querySelectorAll('input, select, button, mat-select, mat-form-field, mat-chip-list'))
+    .map(el => [el.tagName, el.id, el.getAttribute('formcontrolname') || '', el.getAttribute('name') || ''].join(':'))
+    .filter((sig, i, all) => all.indexOf(sig) === i)
+    .sort()
+    .join('|')
+"""
+
+class SelectorRegistry:
+    """
+    Resolves logical element names to selectors. The candidate that worked last time
+    for the same page URL and DOM fingerprint is tried first; the result is kept in a
+    small JSON cache, and entries are evicted as soon as they stop matching.
+    """
+
+    def __init__(self, path=SELECTOR_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.cache = {}
+
+    def page_key(self, page):
+        """Cache key: URL path plus a short hash of the page's form structure."""
+        return self.key_for(page.url, page.evaluate(FINGERPRINT_JS))
+
+    def key_for(self, url, structure):
+        path = urlparse(url).path or '/'
+        fingerprint = hashlib.sha1(structure.encode('utf-8')).hexdigest()[:12]
+        return f"{path}#{fingerprint}"
+
+    def ordered_candidates(self, key, name):
+        candidates = SELECTOR_CANDIDATES[name]
+        winner = self.cache.get(key, {}).get(name)
+        if winner in candidates:
+            return [winner] + [c for c in candidates if c != winner], winner
+        return list(candidates), None
+
+    def settle(self, key, name, selector, winner, visible, error=None):
+        """
+        Record the outcome of trying one candidate: a visible one becomes the cached
+        winner, a cached winner that no longer matches is evicted. True if it is usable.
+        """
+        if error is not None:
+            log.debug(f"Selector {selector} for {name} failed: {error}")
+        elif visible:
+            if selector != winner:
+                self.remember(key, name, selector)
+            return True
+        if selector == winner:
+            log.warning(f"Cached selector for {name} no longer matches, evicting it.")
+            self.forget(key, name)
+        return False
+
+    def resolve(self, page, name):
+        """
+        Return (selector, element handle) for the first visible candidate of the logical
+        element, or (None, None) when none matches.
+        """
+        key = self.page_key(page)
+        candidates, winner = self.ordered_candidates(key, name)
+        for selector in candidates:
+            handle, error = None, None
+            try:
+                handle = page.query_selector(selector)
+                visible = bool(handle) and handle.is_visible()
+            except Exception as e:
+                visible, error = False, e
+            if self.settle(key, name, selector, winner, visible, error):
+                return selector, handle
+        return None, None
+
+    async def resolve_async(self, page, name):
+        """resolve() for an async API page."""
+        key = self.key_for(page.url, await page.evaluate(FINGERPRINT_JS))
+        candidates, winner = self.ordered_candidates(key, name)
+        for selector in candidates:
+            handle, error = None, None
+            try:
+                handle = await page.query_selector(selector)
+                visible = bool(handle) and await handle.is_visible()
+            except Exception as e:
+                visible, error = False, e
+            if self.settle(key, name, selector, winner, visible, error):
+                return selector, handle
+        return None, None
+
+    async def evict_async(self, page, name):
+        """evict() for an async API page."""
+        self.forget(self.key_for(page.url, await page.evaluate(FINGERPRINT_JS)), name)
+
+    def combined(self, name):
+        """All candidates as one selector list, for waiting until any of them appears."""
+        return ', '.join(SELECTOR_CANDIDATES[name])
+
+    def remember(self, key, name, selector):
+        with self.lock:
+            self.cache.setdefault(key, {})[name] = selector
+            self.save()
+
+    def forget(self, key, name):
+        with self.lock:
+            if self.cache.get(key, {}).pop(name, None) is not None:
+                if not self.cache[key]:
+                    del self.cache[key]
+                self.save()
+
+    def evict(self, page, name):
+        """Drop the cached winner for the current page, e.g. after acting on it failed."""
+        self.forget(self.page_key(page), name)
+
+    def save(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.cache, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning(f"Could not save selector cache: {e}")
+
+selector_registry = SelectorRegistry()
@@ -0,0 +1,293 @@
+"""
+Browser/session reuse between runs.
+
+By default every run loads the storage state saved in state.json into a fresh
+context and writes the refreshed state back at the end. To keep the browser
+itself warm between runs, start it once with
+
+    python session.py serve --port 9222
+
+and run the bot with AUTOFORM_CDP_URL=http://127.0.0.1:9222; it then attaches to
+that browser instead of launching one. AUTOFORM_USER_DATA_DIR switches to a
+persistent profile (cookies and HTTP cache on disk) without a separate process.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger('session')
+
+STATE_FILE = os.environ.get('AUTOFORM_STATE_FILE', 'state.json')
+USER_DATA_DIR = os.environ.get('AUTOFORM_USER_DATA_DIR', '')
+CDP_URL = os.environ.get('AUTOFORM_CDP_URL', '')
+
+# Cookies the portal's login sets; without them the stored session cannot be logged in
+LOGIN_COOKIE = 'USERID'
+LOGIN_COOKIE_PREFIX = 'TS01'
+# Shown on the rendered portal only to a visitor who is not logged in
+LOGIN_LINK_SELECTOR = ':text-is("Log In"), :text-is("Login")'
+
+def load_storage_state(path=STATE_FILE):
+    """
+    Read a Playwright storage state file and drop cookies that have already expired.
+    Returns None when there is nothing usable to load.
+    """
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError) as e:
+        log.warning(f"No usable storage state in {path}: {e}")
+        return None
+    now = time.time()
+    cookies = [c for c in state.get('cookies', []) if c.get('expires', -1) < 0 or c['expires'] > now]
+    if len(cookies) != len(state.get('cookies', [])):
+        log.debug(f"Dropped {len(state['cookies']) - len(cookies)} expired cookie(s) from {path}.")
+    state['cookies'] = cookies
+    if not cookies and not state.get('origins'):
+        return None
+    return state
+
+def has_login_cookies(cookies, now=None):
+    """True if cookies include an unexpired USERID and TS01... cookie (session cookies never expire here)."""
+    now = time.time() if now is None else now
+    live = {c['name'] for c in cookies if c.get('expires', -1) < 0 or c['expires'] > now}
+    return LOGIN_COOKIE in live and any(name.startswith(LOGIN_COOKIE_PREFIX) for name in live)
+
+class BrowserSession:
+    """
+    Opens the browser context for a run, reusing what it can: an already running
+    browser over CDP, a persistent profile, or the storage state from state.json.
+    """
+
+    def __init__(self, playwright, headless=False, state_file=STATE_FILE, user_data_dir=USER_DATA_DIR,
+                 cdp_url=CDP_URL, shared_context=True, browser=None):
+        self.playwright = playwright
+        self.headless = headless
+        # When False, an attached browser still gets a fresh context (batch workers need isolated cookies)
+        self.shared_context = shared_context
+        self.state_file = state_file
+        self.user_data_dir = user_data_dir
+        self.cdp_url = cdp_url
+        # A browser passed in belongs to the caller, which closes it after all its sessions
+        self.browser = browser
+        self.owns_browser = browser is None
+        self.context = None
+        self.pages = []
+        self.owns_context = True
+
+    def context_source(self):
+        """
+        Where open() gets the context from once any CDP browser is attached: 'shared' (the
+        warm browser's default context), 'new' (a fresh context in the browser at hand),
+        'persistent' (the profile in user_data_dir) or 'launch' (a new browser).
+        """
+        if self.browser and self.browser.contexts and self.shared_context:
+            return 'shared'
+        if self.browser:
+            return 'new'
+        if self.user_data_dir:
+            return 'persistent'
+        return 'launch'
+
+    def attached(self, browser):
+        log.info(f"Attached to running browser at {self.cdp_url}")
+        return browser
+
+    def attach_failed(self, error):
+        log.warning(f"Could not attach to {self.cdp_url} ({error}), launching a new browser.")
+
+    def attach(self):
+        """Connect to the browser at cdp_url; None if that fails."""
+        try:
+            return self.attached(self.playwright.chromium.connect_over_cdp(self.cdp_url))
+        except Exception as e:
+            self.attach_failed(e)
+            return None
+
+    def open(self):
+        """Open (or attach to) the browser and return the context to run in."""
+        chromium = self.playwright.chromium
+        if self.browser is None and self.cdp_url:
+            self.browser = self.attach()
+        source = self.context_source()
+        if source == 'shared':
+            # The warm browser's default context already holds the cookies and cache
+            self.context = self.browser.contexts[0]
+            self.owns_context = False
+        elif source == 'persistent':
+            self.context = chromium.launch_persistent_context(self.user_data_dir, headless=self.headless)
+            log.info(f"Using persistent profile in {self.user_data_dir}")
+            state = load_storage_state(self.state_file)
+            if state and not self.context.cookies():
+                self.context.add_cookies(state['cookies'])
+        else:
+            if source == 'launch':
+                self.browser = chromium.launch(headless=self.headless)
+            self.context = self.browser.new_context(storage_state=load_storage_state(self.state_file))
+        return self.context
+
+    def new_page(self):
+        page = self.context.new_page()
+        self.pages.append(page)
+        return page
+
+    def cookie_verdict(self, cookies):
+        """
+        What the stored cookies allow validate() to conclude: 'none' (nothing stored),
+        'stale' (no unexpired USERID/TS01... cookies) or 'probe' (the page has to tell).
+        """
+        if not cookies:
+            return 'none'
+        return 'probe' if has_login_cookies(cookies) else 'stale'
+
+    def validate(self, url, ready_selector, timeout):
+        """
+        Check the stored session before it is reused. The login cookies alone do not
+        show it (state.json keeps them as session cookies that never expire), and the
+        portal root is a single-page app that answers 200 either way, so the root is
+        rendered in a throwaway page until ready_selector shows and the session holds
+        if no login link is offered. A stale session has its cookies cleared, so the
+        run starts clean and only has to log in again.
+        """
+        verdict = self.cookie_verdict(self.context.cookies(url))
+        if verdict == 'probe':
+            page = self.context.new_page()
+            try:
+                page.goto(url, wait_until='domcontentloaded', timeout=timeout)
+                page.wait_for_selector(ready_selector, timeout=timeout)
+                if not page.is_visible(LOGIN_LINK_SELECTOR):
+                    return True
+            except Exception as e:
+                log.warning(f"Could not check the stored session: {e}")
+                return False
+            finally:
+                page.close()
+        if verdict != 'none':
+            log.warning("Stored session is stale, clearing cookies.")
+            self.context.clear_cookies()
+        return False
+
+    def save_state(self):
+        """Write the current cookies/local storage back to the state file for the next run."""
+        try:
+            self.context.storage_state(path=self.state_file)
+        except Exception as e:
+            log.warning(f"Could not save storage state: {e}")
+
+    def close(self):
+        """Close what this run opened; a browser attached over CDP is left running."""
+        if self.owns_context:
+            self.context.close()
+        else:
+            for page in self.pages:
+                page.close()
+        if self.browser is not None and self.owns_browser:
+            self.browser.close()
+
+class AsyncBrowserSession(BrowserSession):
+    """BrowserSession for the async API: the same choice of context, with the browser calls awaited."""
+
+    async def attach(self):
+        try:
+            return self.attached(await self.playwright.chromium.connect_over_cdp(self.cdp_url))
+        except Exception as e:
+            self.attach_failed(e)
+            return None
+
+    async def launch(self):
+        """
+        Attach over CDP or launch a browser, without opening a context, for callers
+        that pass one browser to several sessions (browser=...).
+        """
+        browser = await self.attach() if self.cdp_url else None
+        return browser or await self.playwright.chromium.launch(headless=self.headless)
+
+    async def open(self):
+        chromium = self.playwright.chromium
+        if self.browser is None and self.cdp_url:
+            self.browser = await self.attach()
+        source = self.context_source()
+        if source == 'shared':
+            self.context = self.browser.contexts[0]
+            self.owns_context = False
+        elif source == 'persistent':
+            self.context = await chromium.launch_persistent_context(self.user_data_dir, headless=self.headless)
+            log.info(f"Using persistent profile in {self.user_data_dir}")
+            state = load_storage_state(self.state_file)
+            if state and not await self.context.cookies():
+                await self.context.add_cookies(state['cookies'])
+        else:
+            if source == 'launch':
+                self.browser = await chromium.launch(headless=self.headless)
+            self.context = await self.browser.new_context(storage_state=load_storage_state(self.state_file))
+        return self.context
+
+    async def new_page(self):
+        page = await self.context.new_page()
+        self.pages.append(page)
+        return page
+
+    async def validate(self, url, ready_selector, timeout):
+        verdict = self.cookie_verdict(await self.context.cookies(url))
+        if verdict == 'probe':
+            page = await self.context.new_page()
+            try:
+                await page.goto(url, wait_until='domcontentloaded', timeout=timeout)
+                await page.wait_for_selector(ready_selector, timeout=timeout)
+                if not await page.is_visible(LOGIN_LINK_SELECTOR):
+                    return True
+            except Exception as e:
+                log.warning(f"Could not check the stored session: {e}")
+                return False
+            finally:
+                await page.close()
+        if verdict != 'none':
+            log.warning("Stored session is stale, clearing cookies.")
+            await self.context.clear_cookies()
+        return False
+
+    async def save_state(self):
+        try:
+            await self.context.storage_state(path=self.state_file)
+        except Exception as e:
+            log.warning(f"Could not save storage state: {e}")
+
+    async def close(self):
+        if self.owns_context:
+            await self.context.close()
+        else:
+            for page in self.pages:
+                await page.close()
+        if self.browser is not None and self.owns_browser:
+            await self.browser.close()
+
+def serve(port, user_data_dir, headless):
+    """Launch a browser that stays up between runs and accepts CDP connections on the given port."""
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        context = p.chromium.launch_persistent_context(
+            user_data_dir, headless=headless, args=[f'--remote-debugging-port={port}'])
+        state = load_storage_state()
+        if state:
+            context.add_cookies(state['cookies'])
+        print(f"Browser ready; run the bot with AUTOFORM_CDP_URL=http://127.0.0.1:{port} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        context.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Keep a browser warm for the form filler.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Launch a browser that runs attach to over CDP")
+    serve_parser.add_argument('--port', type=int, default=9222)
+    serve_parser.add_argument('--user-data-dir', default=USER_DATA_DIR or '.browser-profile')
+    serve_parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+    serve(args.port, args.user_data_dir, args.headless)
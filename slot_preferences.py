@@ -0,0 +1,208 @@
+"""
+Applicant appointment preferences and the scoring used to pick a slot.
+
+Read from the applicant record (data.json):
+
+    appointment_country, appointment_location   first-choice office
+    appointment_date, appointment_time          preferred slot ('2025-06-13', '09:00 AM')
+    appointment_preferences                     optional:
+        date_windows           [{"from": "2025-06-10", "to": "2025-06-30"}]  only dates inside a window
+        excluded_weekdays      ["Saturday", "Sun"]
+        time_ranges            [{"from": "09:00", "to": "12:00"}]           only times inside a range
+        location_alternatives  [{"country": "Other", "location": "NE, Seoul"}]  tried in order
+
+Windows and ranges are inclusive and either end may be left out. Among the allowed
+slots the one closest to the preferred date wins, then the one closest to the
+preferred time; without a preferred date or time the earliest one wins.
+"""
+import json
+from datetime import date, datetime
+
+from slots import normalize_date, normalize_time
+
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+MINUTES_PER_DAY = 24 * 60
+
+def parse_date(value, field):
+    iso = normalize_date(value)
+    if not iso:
+        raise ValueError(f"{field}: expected a YYYY-MM-DD date, got {value!r}")
+    try:
+        return date.fromisoformat(iso)
+    except ValueError:
+        raise ValueError(f"{field}: {value!r} is not a valid date")
+
+def parse_time(value, field):
+    time_value = normalize_time(value)
+    if not time_value:
+        raise ValueError(f"{field}: expected a time such as '09:00' or '09:00 AM', got {value!r}")
+    return time_value
+
+def parse_weekday(value, field):
+    name = str(value).strip().lower()
+    for index, weekday in enumerate(WEEKDAY_NAMES):
+        if len(name) >= 3 and weekday.startswith(name):
+            return index
+    raise ValueError(f"{field}: unknown weekday {value!r}")
+
+def minutes(time_value):
+    hour, minute = time_value.split(':')
+    return int(hour) * 60 + int(minute)
+
+class SlotPreferences:
+    """Hard constraints (windows, weekdays, time ranges) and the scores that rank the allowed slots."""
+
+    def __init__(self, locations, preferred_date=None, preferred_time=None, date_windows=(),
+                 excluded_weekdays=(), time_ranges=(), today=None):
+        self.locations = list(locations)
+        self.preferred_date = preferred_date
+        self.preferred_time = preferred_time
+        self.date_windows = list(date_windows)
+        self.excluded_weekdays = set(excluded_weekdays)
+        self.time_ranges = [(minutes(start), minutes(end)) for start, end in time_ranges]
+        self.today = today or datetime.now().date()
+
+    def date_allowed(self, day):
+        if day < self.today or day.weekday() in self.excluded_weekdays:
+            return False
+        return not self.date_windows or any(start <= day <= end for start, end in self.date_windows)
+
+    def time_allowed(self, time_value):
+        return not self.time_ranges or any(start <= minutes(time_value) <= end for start, end in self.time_ranges)
+
+    def date_score(self, day):
+        """0 for the preferred date (or today when there is none), one day less per day away."""
+        anchor = self.preferred_date or self.today
+        return -abs((day - anchor).days) * MINUTES_PER_DAY
+
+    def time_score(self, time_value):
+        """Minutes away from the preferred time; a full day of them never outweighs one day of date distance."""
+        if self.preferred_time is None:
+            return -minutes(time_value) / MINUTES_PER_DAY
+        return -abs(minutes(time_value) - minutes(self.preferred_time))
+
+    def rank_dates(self, days):
+        """The allowed days, best first."""
+        allowed = [day for day in set(days) if self.date_allowed(day)]
+        return sorted(allowed, key=lambda day: (-self.date_score(day), day))
+
+    def best_time(self, times):
+        """The best allowed 'HH:MM' of times, or None."""
+        allowed = [t for t in times if self.time_allowed(t)]
+        return max(allowed, key=lambda t: (self.time_score(t), -minutes(t)), default=None)
+
+    def rank_slots(self, slots):
+        """The allowed (day, 'HH:MM') slots, best first."""
+        allowed = [(day, t) for day, t in slots if self.date_allowed(day) and self.time_allowed(t)]
+        return sorted(allowed, key=lambda slot: (-self.date_score(slot[0]) - self.time_score(slot[1]), slot))
+
+    def best_score_from(self, first_day):
+        """
+        Upper bound of date_score() for allowed dates on or after first_day, or None when
+        no such date can be allowed. Lets a calendar scan stop once later months cannot win.
+        """
+        if self.date_windows and first_day > max(end for _, end in self.date_windows):
+            return None
+        anchor = self.preferred_date or self.today
+        if first_day <= anchor:
+            return 0
+        return -(first_day - anchor).days * MINUTES_PER_DAY
+
+def preference_object(data):
+    """The record's appointment_preferences as a dict (empty when absent)."""
+    extra = data.get('appointment_preferences') or {}
+    if isinstance(extra, str):
+        # CSV batch records carry the preferences as a JSON string
+        try:
+            extra = json.loads(extra)
+        except ValueError:
+            raise ValueError("appointment_preferences: not valid JSON")
+    if not isinstance(extra, dict):
+        raise ValueError("appointment_preferences: expected an object")
+    return extra
+
+def preference_list(extra, key):
+    value = extra.get(key, [])
+    if not isinstance(value, list):
+        raise ValueError(f"appointment_preferences.{key}: expected a list, got {value!r}")
+    return value
+
+def parse_locations(data, extra):
+    locations = [(data['appointment_country'], data['appointment_location'])]
+    for i, alternative in enumerate(preference_list(extra, 'location_alternatives')):
+        try:
+            location = (alternative['country'], alternative['location'])
+        except (KeyError, TypeError):
+            raise ValueError(f"appointment_preferences.location_alternatives[{i}]: needs 'country' and 'location'")
+        if location not in locations:
+            locations.append(location)
+    return locations
+
+def parse_date_windows(extra):
+    date_windows = []
+    for i, window in enumerate(preference_list(extra, 'date_windows')):
+        field = f"appointment_preferences.date_windows[{i}]"
+        if not isinstance(window, dict):
+            raise ValueError(f"{field}: expected an object with 'from' and/or 'to'")
+        start = parse_date(window['from'], field + '.from') if window.get('from') else date.min
+        end = parse_date(window['to'], field + '.to') if window.get('to') else date.max
+        if start > end:
+            raise ValueError(f"{field}: 'from' is after 'to'")
+        date_windows.append((start, end))
+    return date_windows
+
+def parse_time_ranges(extra):
+    time_ranges = []
+    for i, time_range in enumerate(preference_list(extra, 'time_ranges')):
+        field = f"appointment_preferences.time_ranges[{i}]"
+        if not isinstance(time_range, dict):
+            raise ValueError(f"{field}: expected an object with 'from' and/or 'to'")
+        start = parse_time(time_range['from'], field + '.from') if time_range.get('from') else '00:00'
+        end = parse_time(time_range['to'], field + '.to') if time_range.get('to') else '23:59'
+        time_ranges.append((start, end))
+    return time_ranges
+
+def parse_excluded_weekdays(extra):
+    return [parse_weekday(value, 'appointment_preferences.excluded_weekdays')
+            for value in preference_list(extra, 'excluded_weekdays')]
+
+def parse_preferred_date(data):
+    return parse_date(data['appointment_date'], 'appointment_date') if data.get('appointment_date') else None
+
+def parse_preferred_time(data):
+    return parse_time(data['appointment_time'], 'appointment_time') if data.get('appointment_time') else None
+
+def preference_errors(data):
+    """
+    Every problem with the record's preferences, one per field, where load_preferences()
+    stops at the first. Missing appointment keys are left to the caller's key checks.
+    """
+    try:
+        extra = preference_object(data)
+    except ValueError as e:
+        return [str(e)]
+    errors = []
+    parsers = [lambda: parse_locations(data, extra), lambda: parse_preferred_date(data),
+               lambda: parse_preferred_time(data), lambda: parse_date_windows(extra),
+               lambda: parse_time_ranges(extra), lambda: parse_excluded_weekdays(extra)]
+    for parse in parsers:
+        try:
+            parse()
+        except KeyError:
+            pass
+        except ValueError as e:
+            errors.append(str(e))
+    return errors
+
+def load_preferences(data, today=None):
+    """Build SlotPreferences from an applicant record. Raises ValueError for malformed values."""
+    extra = preference_object(data)
+    return SlotPreferences(
+        parse_locations(data, extra),
+        preferred_date=parse_preferred_date(data),
+        preferred_time=parse_preferred_time(data),
+        date_windows=parse_date_windows(extra),
+        excluded_weekdays=parse_excluded_weekdays(extra),
+        time_ranges=parse_time_ranges(extra),
+        today=today,
+    )
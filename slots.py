@@ -0,0 +1,194 @@
+import asyncio
+import os
+import re
+
+from logs import get_logger
+
+log = get_logger('slots')
+
+# Responses whose URL matches this pattern are inspected for slot data.
+# The portal's endpoint names are not documented, so the default is broad and
+# can be narrowed with AUTOFORM_SLOT_URL_PATTERN once the endpoint is known.
+SLOT_URL_PATTERN = re.compile(os.environ.get('AUTOFORM_SLOT_URL_PATTERN', r'slot|appointment|calendar|schedule'), re.I)
+
+DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+TIME_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*([AaPp][Mm])?\s*$')
+DATE_KEYS = ('date', 'appointmentDate', 'appointment_date', 'slotDate', 'day')
+TIME_KEYS = ('time', 'startTime', 'start_time', 'slotTime', 'slot', 'label')
+UNAVAILABLE_STATUSES = ('full', 'booked', 'closed', 'unavailable', 'disabled', 'holiday')
+
+def normalize_date(value):
+    """Return 'YYYY-MM-DD' for date-like strings (ISO dates or datetimes), else None."""
+    if not isinstance(value, str):
+        return None
+    match = DATE_RE.match(value.strip())
+    return '-'.join(match.groups()) if match else None
+
+def normalize_time(value):
+    """Return 24h 'HH:MM' for time-like strings such as '9:00', '09:00:00' or '09:00 AM', else None."""
+    if not isinstance(value, str):
+        return None
+    if 'T' in value and normalize_date(value):
+        value = value.split('T', 1)[1][:5]
+    match = TIME_RE.match(value)
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+def _is_available(node):
+    """Interpret the common availability flags on a slot/date object; missing flags mean available."""
+    for key in ('available', 'isAvailable', 'enabled', 'isEnabled'):
+        if key in node and not node[key]:
+            return False
+    for key in ('disabled', 'isDisabled', 'isFull', 'booked', 'isBooked', 'holiday', 'isHoliday'):
+        if node.get(key):
+            return False
+    status = node.get('status')
+    if isinstance(status, str) and status.lower() in UNAVAILABLE_STATUSES:
+        return False
+    for key in ('remaining', 'remainingSlots', 'availableSlots', 'capacity', 'quota'):
+        if isinstance(node.get(key), (int, float)) and node[key] <= 0:
+            return False
+    return True
+
+def _walk(node, current_date, index):
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, current_date, index)
+    elif isinstance(node, dict):
+        date = next((normalize_date(node[k]) for k in DATE_KEYS if normalize_date(node.get(k))), None) or current_date
+        if not _is_available(node):
+            return
+        slot_time = next((normalize_time(node[k]) for k in TIME_KEYS if normalize_time(node.get(k))), None)
+        if date and slot_time:
+            index.setdefault(date, set()).add(slot_time)
+        elif date and date != current_date:
+            # An available date entry; its times may be listed below it or fetched later
+            index.setdefault(date, set())
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                _walk(value, normalize_date(key) or date, index)
+            elif normalize_date(key) and _is_available({'available': value}):
+                index.setdefault(normalize_date(key), set())
+    elif current_date and normalize_time(node):
+        index.setdefault(current_date, set()).add(normalize_time(node))
+
+def parse_slot_payload(payload):
+    """
+    Parse a slot/availability JSON payload into a map of 'YYYY-MM-DD' -> set of 'HH:MM'.
+    Accepts date-keyed maps, lists of date objects with nested time lists and flat lists of
+    date/time objects; entries flagged as unavailable are skipped.
+    """
+    index = {}
+    _walk(payload, None, index)
+    return index
+
+class SlotCapture:
+    """
+    Collects the slot data the appointment calendar downloads, via page.on("response").
+    The index keeps growing while the listener is attached, so slots published between
+    renders are picked up as well.
+    """
+
+    def __init__(self, page, url_pattern=SLOT_URL_PATTERN):
+        self.page = page
+        self.url_pattern = url_pattern
+        self.index = {}
+        self.responses_seen = 0
+        # Responses already merged, so one that both the listener and wait_for_data parse counts once
+        self.merged = set()
+        page.on("response", self.ingest)
+
+    def matches(self, response):
+        """True if the response looks like slot JSON fetched by the app."""
+        if response.request.resource_type not in ('xhr', 'fetch'):
+            return False
+        if not self.url_pattern.search(response.url):
+            return False
+        return 'json' in response.headers.get('content-type', '')
+
+    def ingest(self, response):
+        """Parse a matching response and merge it into the index."""
+        if not self.matches(response) or response in self.merged:
+            return
+        try:
+            payload = response.json()
+        except Exception as e:
+            log.warning(f"Could not parse slot response {response.url}: {e}")
+            return
+        self.merge(response, payload)
+
+    def merge(self, response, payload):
+        if response in self.merged:
+            return
+        self.merged.add(response)
+        self.responses_seen += 1
+        for date, times in parse_slot_payload(payload).items():
+            self.index.setdefault(date, set()).update(times)
+        log.debug(f"Captured slot data from {response.url}: {len(self.index)} date(s) indexed.")
+
+    def wait_for_data(self, timeout):
+        """Block until at least one slot response has been captured, or the timeout expires."""
+        if self.index:
+            return True
+        try:
+            with self.page.expect_response(self.matches, timeout=timeout) as response_info:
+                pass
+            # The listener may still be reading the same response in its own greenlet
+            self.ingest(response_info.value)
+        except Exception:
+            pass
+        return bool(self.index)
+
+    def reset(self):
+        """Forget everything captured so far, e.g. before the calendar loads another location."""
+        self.index = {}
+        self.responses_seen = 0
+        self.merged = set()
+
+    def dates_with_times(self):
+        """Dates that have at least one listed time, in chronological order."""
+        return sorted(date for date, times in self.index.items() if times)
+
+    def times_for(self, date):
+        """Sorted times captured for the given 'YYYY-MM-DD' date."""
+        return sorted(self.index.get(date, ()))
+
+class AsyncSlotCapture(SlotCapture):
+    """
+    SlotCapture for the async API. Each matching response is parsed in its own
+    handler as soon as it arrives, while the page keeps rendering the calendar.
+    """
+
+    def __init__(self, page, url_pattern=SLOT_URL_PATTERN):
+        self.ready = asyncio.Event()
+        super().__init__(page, url_pattern)
+
+    async def ingest(self, response):
+        if not self.matches(response) or response in self.merged:
+            return
+        try:
+            payload = await response.json()
+        except Exception as e:
+            log.warning(f"Could not parse slot response {response.url}: {e}")
+            return
+        self.merge(response, payload)
+        if self.index:
+            self.ready.set()
+
+    def reset(self):
+        super().reset()
+        self.ready.clear()
+
+    async def wait_for_data(self, timeout):
+        """Wait until the listener has indexed at least one slot response, or the timeout (ms) expires."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout / 1000)
+        except asyncio.TimeoutError:
+            pass
+        return bool(self.index)
@@ -0,0 +1,99 @@
+import calendar
+from datetime import date
+
+import pytest
+
+import main
+from slot_preferences import SlotPreferences
+
+TODAY = date(2026, 10, 17)
+
+class FakeLocator:
+    def is_visible(self):
+        return False
+
+class FakePage:
+    """Stands in for the page; the calendar helpers that use it are patched below."""
+
+    def locator(self, selector):
+        return FakeLocator()
+
+    def is_visible(self, selector):
+        return True
+
+class FakeCalendar:
+    """A date picker over {(year, month): [available days]}, showing start (today's month by default)."""
+
+    def __init__(self, available, start=(TODAY.year, TODAY.month)):
+        self.available = available
+        self.shown = start
+        self.tried = []
+
+    def snapshot(self, page, month_index=0):
+        year, month = self.shown
+        raw = {'title': f"{calendar.month_name[month].upper()} {year}",
+               'days': {str(day): 'available' for day in self.available.get(self.shown, [])}}
+        return main.calendar_snapshot(raw, month_index)
+
+    def next_month(self, page):
+        self.shown = main.add_months(*self.shown, 1)
+        return True
+
+    def go_to_month(self, page, year, month):
+        self.shown = (year, month)
+        return self.snapshot(page)
+
+@pytest.fixture
+def fake_calendar(monkeypatch):
+    def install(available, offers_time, **kwargs):
+        fake = FakeCalendar(available, **kwargs)
+
+        def select_slot_on(page, day, preferences, times=None):
+            fake.tried.append(day)
+            return offers_time(day)
+
+        monkeypatch.setattr(main, 'snapshot_calendar', fake.snapshot)
+        monkeypatch.setattr(main, 'go_to_next_month', fake.next_month)
+        monkeypatch.setattr(main, 'go_to_month', fake.go_to_month)
+        monkeypatch.setattr(main, 'select_slot_on', select_slot_on)
+        monkeypatch.setattr(main, 'reopen_date_picker', lambda page: None)
+        return fake
+    return install
+
+def preferences(**kwargs):
+    return SlotPreferences([('Other', 'NE, Tokyo')], today=TODAY, **kwargs)
+
+def test_scan_stops_at_the_first_month_with_an_allowed_day(fake_calendar):
+    fake = fake_calendar({(2026, 11): [5, 20], (2026, 12): [1]}, lambda day: True)
+    scan = main.CalendarScan(preferences())
+    assert main.scan_calendar(FakePage(), scan) == [date(2026, 11, 5), date(2026, 11, 20)]
+    assert scan.months_read == 2
+    assert fake.shown == (2026, 11)
+
+def test_scan_resumes_after_the_last_month_when_every_candidate_fails(fake_calendar):
+    fake = fake_calendar({(2026, 11): [5, 20], (2027, 1): [8]}, lambda day: day.month == 1)
+    assert main.choose_calendar_slot(FakePage(), preferences())
+    assert fake.tried == [date(2026, 11, 5), date(2026, 11, 20), date(2027, 1, 8)]
+
+def test_resumed_scan_gives_up_at_the_month_limit(fake_calendar):
+    fake = fake_calendar({(2026, 11): [5]}, lambda day: False)
+    assert not main.choose_calendar_slot(FakePage(), preferences())
+    assert fake.tried == [date(2026, 11, 5)]
+    assert fake.shown == main.add_months(TODAY.year, TODAY.month, main.MAX_MONTHS_TO_CHECK - 1)
+
+def test_resumed_scan_stops_after_the_last_date_window(fake_calendar):
+    prefs = preferences(date_windows=[(date(2026, 10, 1), date(2026, 11, 30))])
+    fake = fake_calendar({(2026, 11): [5], (2026, 12): [1]}, lambda day: False)
+    assert not main.choose_calendar_slot(FakePage(), prefs)
+    assert fake.tried == [date(2026, 11, 5)]
+
+def test_scan_starts_at_the_current_month_wherever_the_picker_was_left(fake_calendar):
+    fake = fake_calendar({(2026, 11): [5]}, lambda day: True, start=(2027, 2))
+    assert main.choose_calendar_slot(FakePage(), preferences())
+    assert fake.tried == [date(2026, 11, 5)]
+
+def test_scan_fails_when_the_current_month_cannot_be_reached(fake_calendar, monkeypatch):
+    fake_calendar({(2026, 11): [5]}, lambda day: True, start=(2027, 2))
+    monkeypatch.setattr(main, 'go_to_month', lambda page, year, month: None)
+    with pytest.raises(Exception, match='2026-10'):
+        main.choose_calendar_slot(FakePage(), preferences())
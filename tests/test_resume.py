@@ -0,0 +1,72 @@
+import pytest
+
+import main
+
+class FakePage:
+    """A page at the portal path on which only the given selectors are visible."""
+
+    def __init__(self, path, visible=()):
+        self.url = main.portal_url(path)
+        self.visible = set(visible)
+
+    def is_visible(self, selector):
+        return selector in self.visible
+
+    def screenshot(self, **kwargs):
+        pass
+
+    def wait_for_timeout(self, timeout):
+        pass
+
+class Handoff:
+    def withdraw(self):
+        pass
+
+def state_index(state):
+    return main.STATE_IDS.index(state)
+
+def test_unfinished_request_form_is_run_again():
+    page = FakePage('request-form', [main.PAGE_READY_SELECTORS['request_form']])
+    assert main.resume_index(page, state_index('request_form')) == state_index('request_form')
+
+def test_submitted_request_form_goes_on_with_the_final_screenshot():
+    page = FakePage('request-form', [main.FORM_SUBMITTED_SELECTOR])
+    assert main.resume_index(page, state_index('request_form')) == state_index('final_screenshot')
+
+def test_passport_type_is_run_again_although_proceed_is_visible():
+    page = FakePage('request-service', [main.selector_registry.combined('proceed')])
+    assert main.resume_index(page, state_index('passport_type')) == state_index('passport_type')
+
+def test_first_issuance_goes_on_once_the_page_changed():
+    page = FakePage('request-service')
+    assert main.resume_index(page, state_index('first_issuance')) == state_index('passport_type')
+
+@pytest.fixture
+def fake_steps(monkeypatch):
+    """Replace every step with one that records its state and fails in the given ones."""
+    def install(failing):
+        ran = []
+
+        def step(state):
+            def run_step(page, run):
+                ran.append(state)
+                if state in failing:
+                    raise Exception(f"{state} timed out")
+            return run_step
+
+        monkeypatch.setattr(main, 'STATES', [(state, label, step(state), check)
+                                             for state, label, _, check in main.STATES])
+        monkeypatch.setattr(main, 'dom_snapshot', lambda *args, **kwargs: None)
+        return ran
+    return install
+
+def test_a_failing_request_form_never_reports_success(fake_steps):
+    ran = fake_steps({'request_form'})
+    statuses = []
+    run = {'captcha': Handoff(), 'checkpoint': lambda status, **details: statuses.append((status, details['state']))}
+    page = FakePage('request-form', [main.PAGE_READY_SELECTORS['request_form']])
+
+    assert not main.run_with_retries(page, run)
+    assert 'final_screenshot' not in ran
+    assert ran[state_index('request_form'):] == ['request_form'] * main.STATE_RETRY_BUDGET['default']
+    assert statuses[-1] == ('Failed', 'request_form')
@@ -0,0 +1,50 @@
+from datetime import date
+
+from slot_preferences import SlotPreferences
+
+TODAY = date(2026, 10, 17)
+
+def preferences(**kwargs):
+    return SlotPreferences([('Other', 'NE, Tokyo')], today=TODAY, **kwargs)
+
+def test_rank_slots_prefers_the_closest_date_over_the_closest_time():
+    prefs = preferences(preferred_date=date(2026, 11, 10), preferred_time='09:00')
+    slots = [
+        (date(2026, 11, 12), '09:00'),
+        (date(2026, 11, 9), '15:30'),
+        (date(2026, 11, 9), '09:30'),
+        (date(2026, 11, 10), '16:00'),
+    ]
+    assert prefs.rank_slots(slots) == [
+        (date(2026, 11, 10), '16:00'),
+        (date(2026, 11, 9), '09:30'),
+        (date(2026, 11, 9), '15:30'),
+        (date(2026, 11, 12), '09:00'),
+    ]
+
+def test_rank_slots_without_preferences_is_earliest_first_and_drops_disallowed_slots():
+    prefs = preferences(time_ranges=[('09:00', '12:00')], excluded_weekdays=[5, 6])
+    slots = [
+        (date(2026, 10, 21), '10:00'),
+        (date(2026, 10, 20), '11:00'),
+        (date(2026, 10, 20), '09:30'),
+        (date(2026, 10, 20), '13:00'),  # outside the time range
+        (date(2026, 10, 24), '09:00'),  # a Saturday
+        (date(2026, 10, 16), '09:00'),  # before today
+    ]
+    assert prefs.rank_slots(slots) == [
+        (date(2026, 10, 20), '09:30'),
+        (date(2026, 10, 20), '11:00'),
+        (date(2026, 10, 21), '10:00'),
+    ]
+
+def test_best_score_from_bounds_every_later_date():
+    prefs = preferences(preferred_date=date(2026, 12, 10))
+    for first_day in (date(2026, 11, 1), date(2026, 12, 1), date(2026, 12, 10), date(2027, 1, 1)):
+        later_days = [date.fromordinal(first_day.toordinal() + offset) for offset in range(60)]
+        assert prefs.best_score_from(first_day) == max(prefs.date_score(day) for day in later_days)
+
+def test_best_score_from_is_none_after_the_last_date_window():
+    prefs = preferences(date_windows=[(date(2026, 11, 1), date(2026, 11, 30))])
+    assert prefs.best_score_from(date(2026, 11, 1)) == prefs.date_score(date(2026, 11, 1))
+    assert prefs.best_score_from(date(2026, 12, 1)) is None
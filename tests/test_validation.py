@@ -0,0 +1,23 @@
+import json
+import os
+
+from validation import validate_record
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'mock_portal', 'fixtures', 'applicant.json')
+
+def applicant(**preferences):
+    with open(FIXTURE, 'r') as f:
+        record = json.load(f)
+    record['appointment_preferences'] = preferences
+    return record
+
+def test_every_malformed_preference_is_reported():
+    errors = validate_record(applicant(date_windows=[{'from': '2026-13-01'}], time_ranges=[{'to': '25:00'}]))
+    assert len(errors) == 2
+    assert errors[0].startswith('appointment_preferences.date_windows[0].from')
+    assert errors[1].startswith('appointment_preferences.time_ranges[0].to')
+
+def test_a_preference_that_is_not_a_list_is_reported_as_such():
+    assert validate_record(applicant(excluded_weekdays='Saturday')) == [
+        "appointment_preferences.excluded_weekdays: expected a list, got 'Saturday'"]
@@ -0,0 +1,188 @@
+import contextvars
+import functools
+import inspect
+import json
+import time
+import uuid
+from contextlib import contextmanager
+
+from playwright.async_api import ElementHandle as AsyncElementHandle, Frame as AsyncFrame, Locator as AsyncLocator
+from playwright.sync_api import ElementHandle, Frame, Locator
+
+from logs import get_logger
+
+log = get_logger('tracing')
+
+# Page/locator methods that are resolved locally and never reach the browser
+LOCAL_CALLS = {
+    'locator', 'get_by_text', 'get_by_role', 'get_by_label', 'get_by_placeholder', 'get_by_test_id',
+    'frame_locator', 'first', 'last', 'nth', 'filter', 'and_', 'or_',
+    'on', 'once', 'remove_listener', 'set_default_timeout', 'set_default_navigation_timeout',
+    'expect_response', 'expect_request', 'expect_navigation', 'expect_event',
+}
+WRAPPED_TYPES = (Locator, ElementHandle, Frame, AsyncLocator, AsyncElementHandle, AsyncFrame)
+
+# Per thread and per asyncio task, so concurrent runs each trace into their own tracer
+_current = contextvars.ContextVar('autoform_tracer', default=None)
+
+def _unwrap(value):
+    return value._target if isinstance(value, CountingProxy) else value
+
+class CountingProxy:
+    """
+    Wraps a Page (and the locators/handles it returns) and counts every call that
+    goes to the browser on the tracer. Counts are approximate: waits that poll the
+    browser count once.
+    """
+
+    def __init__(self, target, tracer):
+        self._target = target
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if isinstance(value, WRAPPED_TYPES):
+            return CountingProxy(value, self._tracer)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            if name not in LOCAL_CALLS:
+                self._tracer.round_trips += 1
+            result = value(*(_unwrap(a) for a in args), **{k: _unwrap(v) for k, v in kwargs.items()})
+            if inspect.iscoroutine(result):
+                return self._wrap_awaited(result)
+            return self._wrap(result)
+        return call
+
+    def _wrap(self, result):
+        if isinstance(result, WRAPPED_TYPES):
+            return CountingProxy(result, self._tracer)
+        if isinstance(result, list) and result and isinstance(result[0], WRAPPED_TYPES):
+            return [CountingProxy(item, self._tracer) for item in result]
+        return result
+
+    async def _wrap_awaited(self, coroutine):
+        # Async API calls return coroutines; wrap what they resolve to
+        return self._wrap(await coroutine)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return f"CountingProxy({self._target!r})"
+
+class Tracer:
+    """
+    Records spans (wall time, browser round-trips, outcome) as JSON lines and keeps
+    them in memory for the end-of-run summary.
+    """
+
+    def __init__(self, path='trace.jsonl', run_id=None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.round_trips = 0
+        self.spans = []
+        self._stack = []
+
+    def wrap_page(self, page):
+        """Return a page proxy whose browser calls are counted on this tracer."""
+        return CountingProxy(page, self)
+
+    @contextmanager
+    def span(self, name, kind='step', **attrs):
+        record = {
+            'run_id': self.run_id,
+            'span_id': uuid.uuid4().hex[:8],
+            'parent_id': self._stack[-1]['span_id'] if self._stack else None,
+            'name': name,
+            'kind': kind,
+            'start': time.time(),
+        }
+        record.update(attrs)
+        self._stack.append(record)
+        started = time.perf_counter()
+        round_trips = self.round_trips
+        try:
+            yield record
+            record['outcome'] = record.get('outcome', 'ok')
+        except BaseException as e:
+            record['outcome'] = 'error'
+            record['error'] = f"{type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            record['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            record['round_trips'] = self.round_trips - round_trips
+            self._stack.pop()
+            self.spans.append(record)
+            self._write(record)
+
+    def _write(self, record):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            log.warning(f"Could not write trace record: {e}")
+
+    def summary(self):
+        """Per-span-name totals in the order the spans first finished."""
+        rows = {}
+        for record in self.spans:
+            row = rows.setdefault(record['name'], {'kind': record['kind'], 'count': 0, 'total_ms': 0.0,
+                                                   'round_trips': 0, 'errors': 0})
+            row['count'] += 1
+            row['total_ms'] += record['duration_ms']
+            row['round_trips'] += record['round_trips']
+            row['errors'] += record['outcome'] == 'error'
+        return rows
+
+    def print_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        width = max(len(name) for name in rows)
+        print(f"\nRun {self.run_id} trace summary")
+        print(f"{'Span'.ljust(width)}  {'kind':<11} {'count':>5} {'total s':>9} {'trips':>6} {'errors':>6}")
+        for name, row in rows.items():
+            print(f"{name.ljust(width)}  {row['kind']:<11} {row['count']:>5} {row['total_ms'] / 1000:>9.2f} "
+                  f"{row['round_trips']:>6} {row['errors']:>6}")
+
+def set_tracer(tracer):
+    """Make tracer the current one for this thread or asyncio task (None disables tracing)."""
+    _current.set(tracer)
+
+def current_tracer():
+    return _current.get()
+
+@contextmanager
+def span(name, kind='step', **attrs):
+    """Span on the current thread's tracer; a no-op when tracing is not set up."""
+    tracer = current_tracer()
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, kind, **attrs) as record:
+        yield record
+
+def traced(kind):
+    """Decorator that wraps every call of the function in a span named after it."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(func.__name__, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(func.__name__, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
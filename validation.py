@@ -0,0 +1,110 @@
+"""
+Checks an applicant record before a browser is started and compiles its fill plans.
+
+Every request-form key must be present as text, dates must be well-formed, the
+appointment preferences must parse, and dropdown values must be among the options
+the portal offered for that select on earlier runs (see option_cache.py; selects
+whose options have not been seen yet are not checked).
+"""
+import difflib
+import re
+from datetime import date
+
+from form_fill import FORM_SECTIONS, build_fill_plan
+from option_cache import select_option_cache
+from slot_preferences import preference_errors
+from slots import normalize_date
+
+APPOINTMENT_KEYS = ('appointment_country', 'appointment_location')
+AD_DATE_KEYS = ('dob_ad',)
+# Bikram Sambat dates cannot be checked with the Gregorian calendar; months have up to 32 days
+BS_DATE_KEYS = ('dob_bs', 'citizenship_issue_date_bs')
+BS_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+
+class InvalidRecord(ValueError):
+    """Raised by prepare_record(); errors lists every problem found, not just the first."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+def required_keys():
+    keys = list(APPOINTMENT_KEYS)
+    for fields in FORM_SECTIONS.values():
+        keys.extend(key for key, _, _ in fields)
+    return keys
+
+def check_dates(data):
+    errors = []
+    for key in AD_DATE_KEYS:
+        value = data.get(key)
+        if not isinstance(value, str) or not value.strip():
+            continue
+        if not normalize_date(value) or len(value.strip()) != 10:
+            errors.append(f"{key}: expected a YYYY-MM-DD date, got {value!r}")
+            continue
+        try:
+            day = date.fromisoformat(value.strip())
+        except ValueError:
+            errors.append(f"{key}: {value!r} is not a valid date")
+            continue
+        if day > date.today():
+            errors.append(f"{key}: {value!r} is in the future")
+    for key in BS_DATE_KEYS:
+        value = data.get(key)
+        if not isinstance(value, str) or not value.strip():
+            continue
+        match = BS_DATE_RE.match(value.strip())
+        if not match:
+            errors.append(f"{key}: expected a YYYY-MM-DD Bikram Sambat date, got {value!r}")
+            continue
+        year, month, day = (int(part) for part in match.groups())
+        if not (1900 <= year <= 2200 and 1 <= month <= 12 and 1 <= day <= 32):
+            errors.append(f"{key}: {value!r} is not a valid Bikram Sambat date")
+    return errors
+
+def check_select_options(plans):
+    """Compare every select value with the cached options of that select, given the selects filled before it."""
+    errors = []
+    for plan in plans.values():
+        context = []
+        for field in plan:
+            if field['kind'] != 'select':
+                continue
+            labels = select_option_cache.labels_for(field['selector'], context)
+            if labels is not None and field['value'].strip() not in labels:
+                close = difflib.get_close_matches(field['value'].strip(), labels, n=3)
+                hint = f" (did you mean {', '.join(repr(c) for c in close)}?)" if close else ''
+                errors.append(f"{field['key']}: {field['value']!r} is not an option of {field['selector']}{hint}")
+            context.append(field['value'])
+    return errors
+
+def compile_fill_plans(data):
+    """The fill plan of every request-form section, keyed by section name."""
+    return {section: build_fill_plan(section, data) for section in FORM_SECTIONS}
+
+def validate_record(data):
+    """Return the list of problems with an applicant record (empty when it is usable)."""
+    if not isinstance(data, dict):
+        return ["record is not a JSON object"]
+    errors = []
+    for key in required_keys():
+        value = data.get(key)
+        if value is None:
+            errors.append(f"{key}: missing")
+        elif not isinstance(value, str):
+            errors.append(f"{key}: expected text, got {value!r}")
+        elif not value.strip():
+            errors.append(f"{key}: empty")
+    errors.extend(check_dates(data))
+    errors.extend(preference_errors(data))
+    if not errors:
+        errors.extend(check_select_options(compile_fill_plans(data)))
+    return errors
+
+def prepare_record(data):
+    """Validate an applicant record and return its compiled fill plans. Raises InvalidRecord."""
+    errors = validate_record(data)
+    if errors:
+        raise InvalidRecord(errors)
+    return compile_fill_plans(data)